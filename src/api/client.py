@@ -1,13 +1,65 @@
+import itertools
 import logging
+import threading
 import typing
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Callable, Any
+from operator import itemgetter
+from typing import Callable, Any, Iterable, Iterator
+from urllib.parse import urlencode, quote
 
 import requests
+from requests.adapters import HTTPAdapter
+from requests_cache import CachedSession, DO_NOT_CACHE
+from urllib3.util.retry import Retry
+
+try:
+    # Szybszy parser JSON, jeśli jest dostępny
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+try:
+    # Parser dat ISO 8601 napisany w C
+    from ciso8601 import parse_datetime
+except ImportError:
+    parse_datetime = datetime.fromisoformat
 
 import src.api.exceptions as exceptions
 import src.api.models as models
 from src.api.exceptions import APIError, TooManyRequests
+from src.config import UPDATE_INTERVALS
+
+logger = logging.getLogger(__name__)
+
+# Pobieranie wszystkich pól rekordu jednym wywołaniem, w kolejności pól modelu
+_station_fields = itemgetter(
+    "Identyfikator stacji",  # id
+    "Kod stacji",            # codename
+    "Nazwa stacji",          # name
+    "Powiat",                # district
+    "Województwo",           # voivodeship
+    "Nazwa miasta",          # city
+    "Ulica",                 # address
+    "WGS84 φ N",             # latitude
+    "WGS84 λ E",             # longitude
+)
+_sensor_fields = itemgetter(
+    "Identyfikator stanowiska",  # id
+    "Wskaźnik - kod",            # codename
+    "Wskaźnik",                  # name
+)
+
+# (wskaźnik, klucz daty, klucz wartości) indeksów cząstkowych w odpowiedzi aqindex/getIndex
+_POLLUTANT_INDEX_KEYS = tuple(
+    (
+        pollutant,
+        f"Data wykonania obliczeń indeksu dla wskaźnika {pollutant}",
+        f"Wartość indeksu dla wskaźnika {pollutant}",
+    )
+    for pollutant in ("NO2", "O3", "PM10", "PM2.5", "SO2")
+)
 
 
 class Client:
@@ -18,9 +70,55 @@ class Client:
     """
 
     __BASE = "https://api.gios.gov.pl"
+    # Maksymalna liczba jednoczesnych połączeń z API utrzymywanych w sesji
+    _MAX_CONNECTIONS = 16
+    # Wspólna pula wątków do równoległego pobierania kolejnych stron wyników
+    _executor = ThreadPoolExecutor(max_workers=_MAX_CONNECTIONS)
+    # Ostatnio zwrócona liczba stron dla adresu pierwszej strony zapytania (LRU, adresy
+    # archiwalne zawierają daty, więc liczba kluczy musi być ograniczona)
+    _PAGE_COUNTS_SIZE = 256
+    _page_counts: OrderedDict[str, int] = OrderedDict()
+    _page_counts_lock = threading.Lock()
     _connection_status: bool = True
     connection_status_changed : typing.Callable[[bool],None] = None
 
+    def __init__(self, cache_name: str = "api_cache"):
+        """
+        Tworzy sesję HTTP współdzieloną przez wszystkie żądania klienta.
+
+        Sesja utrzymuje pulę połączeń (keep-alive), dzięki czemu kolejne strony wyników
+        nie wymagają ponownego nawiązywania połączenia TCP/TLS. Błędy bramy (502-504)
+        są automatycznie ponawiane. Odpowiedzi rzadko zmieniających się endpointów są
+        przechowywane w pamięci podręcznej na dysku przez czas z `UPDATE_INTERVALS`.
+
+        Args:
+            cache_name (str, opcjonalnie): Ścieżka pliku SQLite pamięci podręcznej odpowiedzi.
+        """
+        adapter = HTTPAdapter(
+            pool_connections=self._MAX_CONNECTIONS,
+            pool_maxsize=self._MAX_CONNECTIONS,
+            # Nadmiarowe żądania czekają na wolne połączenie z puli zamiast otwierać
+            # nowe, które po użyciu byłoby zamykane (brak keep-alive)
+            pool_block=True,
+            max_retries=Retry(
+                total=3,
+                backoff_factor=0.3,
+                status_forcelist=[502, 503, 504],
+                raise_on_status=False,
+            ),
+        )
+        self._session = CachedSession(
+            cache_name,
+            backend="sqlite",
+            expire_after=DO_NOT_CACHE,
+            urls_expire_after={
+                "api.gios.gov.pl/pjp-api/v1/rest/station/findAll": UPDATE_INTERVALS["station"],
+                "api.gios.gov.pl/pjp-api/v1/rest/station/sensors": UPDATE_INTERVALS["sensors"],
+                "api.gios.gov.pl/pjp-api/v1/rest/aqindex/getIndex": UPDATE_INTERVALS["aq_indexes"],
+            },
+        )
+        self._session.mount("https://", adapter)
+
     @property
     def connection_status(self):
         return self._connection_status
@@ -54,12 +152,10 @@ class Client:
         Returns:
             str: Pełny adres URL gotowy do wywołania przez requests.get().
         """
-        if args is None:
-            args = {}
         url = f"{self.__BASE}/{endpoint}?page={page}&size={size}"
-        for key, value in args.items():
-            url += f"&{key}={value}"
-        return url
+        if not args:
+            return url
+        return f"{url}&{urlencode(args, quote_via=quote)}"
 
     def _get(
         self,
@@ -86,14 +182,14 @@ class Client:
         """
         try:
             url = self.make_url(endpoint, page, size, args)
-            logging.info(f"API Request: {url}")
-            response = requests.get(url, timeout=None)
+            logger.info("API Request: %s", url)
+            response = self._session.get(url, timeout=None)
             self.connection_status = True
             response.raise_for_status()
-            logging.info(f"API Request finished!")
-            return response.json()
+            logger.info("API Request finished!")
+            return json_loads(response.content)
         except requests.exceptions.HTTPError as http_err:
-            logging.error(f"API Request error!")
+            logger.error("API Request error!")
             payload = http_err.response.json()
             raise exceptions.APIError(
                 code=payload.get("error_code"),
@@ -105,6 +201,82 @@ class Client:
             self.connection_status = False
             raise conn_err
 
+    def _get_pages(
+        self,
+        endpoint: str,
+        pages: Iterable[int],
+        size: int,
+        args: dict[str, Any] = None,
+    ) -> Iterator[Any]:
+        """
+        Wysyła równolegle żądania o podane strony wyników, korzystając ze wspólnej puli wątków
+        i połączeń sesji HTTP.
+
+        Args:
+            endpoint (str): Ścieżka API.
+            pages (Iterable[int]): Numery stron do pobrania.
+            size (int): Rozmiar strony.
+            args (dict[str, Any], opcjonalnie): Dodatkowe parametry query string.
+
+        Returns:
+            Iterator[Any]: Zdeserializowane odpowiedzi w kolejności numerów stron.
+        """
+        return self._executor.map(
+            lambda page: self._get(endpoint, page=page, size=size, args=args),
+            pages,
+        )
+
+    def _get_all_pages(
+        self,
+        endpoint: str,
+        size: int,
+        args: dict[str, Any] = None,
+        sequential: bool = False,
+    ) -> Iterator[Any]:
+        """
+        Zwraca odpowiedzi dla wszystkich stron wyników, w kolejności stron.
+
+        Liczba stron (`totalPages`) zwrócona przy poprzednim zapytaniu o ten sam adres jest
+        zapamiętywana, więc przy kolejnym wywołaniu wszystkie strony, łącznie z pierwszą,
+        są wysyłane równolegle od razu. Jeśli liczba stron wzrosła, brakujące strony
+        dobierane są po otrzymaniu pierwszej odpowiedzi; nadmiarowe są pomijane.
+
+        Args:
+            endpoint (str): Ścieżka API.
+            size (int): Rozmiar strony.
+            args (dict[str, Any], opcjonalnie): Dodatkowe parametry query string.
+            sequential (bool, opcjonalnie): Pobiera strony pojedynczo, jedna po drugiej
+                (dla endpointów z limitem liczby żądań). Domyślnie False.
+
+        Returns:
+            Iterator[Any]: Zdeserializowane odpowiedzi kolejnych stron.
+        """
+        if sequential:
+            response = self._get(endpoint, page=0, size=size, args=args)
+            yield response
+            for page in range(1, int(response.get("totalPages", 1))):
+                yield self._get(endpoint, page=page, size=size, args=args)
+            return
+
+        key = self.make_url(endpoint, size=size, args=args)
+        with self._page_counts_lock:
+            expected_pages = self._page_counts.get(key, 1)
+
+        responses = self._get_pages(endpoint, range(expected_pages), size, args)
+        response = next(responses)
+        # Pusty wynik zwraca totalPages = 0 - pierwsza strona i tak została już pobrana
+        total_pages = max(int(response.get("totalPages", 1)), 1)
+        with self._page_counts_lock:
+            self._page_counts[key] = total_pages
+            self._page_counts.move_to_end(key)
+            if len(self._page_counts) > self._PAGE_COUNTS_SIZE:
+                self._page_counts.popitem(last=False)
+        yield response
+
+        yield from itertools.islice(responses, total_pages - 1)
+        if total_pages > expected_pages:
+            yield from self._get_pages(endpoint, range(expected_pages, total_pages), size, args)
+
     def _get_collected(
         self,
         endpoint: str,
@@ -126,26 +298,20 @@ class Client:
         Raises:
             TypeError: Gdy zwrócony fragment JSON nie jest listą ani słownikiem.
         """
-        response = self._get(endpoint, size=size, args=args)
-        total_pages = int(response.get("totalPages", 1))
-        fragment = response.get(target)
-
-        if isinstance(fragment, list):
-            result = list(fragment)
-        elif isinstance(fragment, dict):
-            result = dict(fragment)
-        else:
+        responses = self._get_all_pages(endpoint, size, args)
+        fragment = next(responses).get(target)
+
+        if not isinstance(fragment, (list, dict)):
             raise TypeError(f"Nieoczekiwany typ danych: {type(fragment).__name__}")
 
-        for page in range(1, total_pages):
-            response = self._get(endpoint, page=page, args=args)
-            fragment = response.get(target)
-            if isinstance(fragment, list):
-                result.extend(fragment)
-            elif isinstance(fragment, dict):
-                result.update(fragment)
-            else:
-                raise TypeError(f"Nieoczekiwany typ danych: {type(fragment).__name__}")
+        # Fragment pochodzi prosto z parsera JSON i nikt inny go nie przechowuje,
+        # więc kolejne strony można do niego dołączać bez kopiowania
+        result = fragment
+
+        # Typ danych jest ustalony przez pierwszą stronę, kolejne strony mają ten sam
+        merge = result.extend if isinstance(result, list) else result.update
+        for response in responses:
+            merge(response.get(target))
 
         return result
 
@@ -156,6 +322,7 @@ class Client:
         callback: Callable[[Any], None],
         size: int = 500, # Maksymalna wielkość API
         args: dict[str, Any] = None,
+        sequential: bool = False,
     ) -> None:
         """
         Iteruje po wszystkich stronach wyników i wywołuje funkcję callback dla każdego fragmentu target.
@@ -166,13 +333,10 @@ class Client:
             callback (Callable[[Any], None]): Funkcja przetwarzająca fragment danych.
             size (int, opcjonalnie): Liczba rekordów na stronę. Domyślnie 500.
             args (dict[str, Any], opcjonalnie): Dodatkowe parametry query string.
+            sequential (bool, opcjonalnie): Pobiera strony pojedynczo zamiast równolegle.
+                Domyślnie False.
         """
-        response = self._get(endpoint, size=size, args=args)
-        total_pages = int(response.get("totalPages", 1))
-
-        for page in range(total_pages):
-            if page > 0:
-                response = self._get(endpoint, page=page, args=args)
+        for response in self._get_all_pages(endpoint, size, args, sequential):
             callback(response.get(target))
 
     def fetch_stations(self) -> list[models.Station]:
@@ -186,20 +350,7 @@ class Client:
             endpoint="pjp-api/v1/rest/station/findAll",
             target="Lista stacji pomiarowych",
         )
-        return [
-            models.Station(
-                id=entry["Identyfikator stacji"],
-                codename=entry["Kod stacji"],
-                name=entry["Nazwa stacji"],
-                district=entry["Powiat"],
-                voivodeship=entry["Województwo"],
-                city=entry["Nazwa miasta"],
-                address=entry["Ulica"],
-                latitude=entry["WGS84 φ N"],
-                longitude=entry["WGS84 λ E"],
-            )
-            for entry in raw
-        ]
+        return [models.Station(*_station_fields(entry)) for entry in raw]
 
     def fetch_station_meta(
         self,
@@ -231,9 +382,9 @@ class Client:
             models.StationMeta(
                 codename=entry["Kod stacji"],
                 international_codename=entry["Kod międzynarodowy"],
-                launch_date=datetime.fromisoformat(entry["Data uruchomienia"]),
+                launch_date=parse_datetime(entry["Data uruchomienia"]),
                 close_date=(
-                    datetime.fromisoformat(entry["Data zamknięcia"])
+                    parse_datetime(entry["Data zamknięcia"])
                     if entry.get("Data zamknięcia")
                     else None
                 ),
@@ -265,17 +416,17 @@ class Client:
 
         def parse_date(key: str) -> typing.Optional[datetime]:
             value = raw.get(key)
-            return datetime.fromisoformat(value) if value else None
+            return parse_datetime(value) if value else None
 
         overall = models.Index(
             date=parse_date("Data wykonania obliczeń indeksu"),
             value=raw.get("Wartość indeksu"),
         )
         sensors: dict[str, models.Index] = {}
-        for pollutant in ["NO2", "O3", "PM10", "PM2.5", "SO2"]:
+        for pollutant, date_key, value_key in _POLLUTANT_INDEX_KEYS:
             sensors[pollutant] = models.Index(
-                date=parse_date(f"Data wykonania obliczeń indeksu dla wskaźnika {pollutant}"),
-                value=raw.get(f"Wartość indeksu dla wskaźnika {pollutant}"),
+                date=parse_date(date_key),
+                value=raw.get(value_key),
             )
 
         return models.AirQualityIndexes(
@@ -299,14 +450,7 @@ class Client:
             endpoint=f"pjp-api/v1/rest/station/sensors/{station_id}",
             target="Lista stanowisk pomiarowych dla podanej stacji",
         )
-        return [
-            models.Sensor(
-                id=entry["Identyfikator stanowiska"],
-                codename=entry["Wskaźnik - kod"],
-                name=entry["Wskaźnik"],
-            )
-            for entry in raw
-        ]
+        return [models.Sensor(*_sensor_fields(entry)) for entry in raw]
 
     def fetch_sensor_data(self, sensor_id: int) -> list[models.SensorData]:
         """
@@ -321,15 +465,12 @@ class Client:
         result: list[models.SensorData] = []
 
         def collect(data: list[dict[str, Any]]) -> None:
-            for entry in data:
-                value = entry.get("Wartość")
-                if value is not None:
-                    result.append(
-                        models.SensorData(
-                            date=datetime.fromisoformat(entry["Data"]),
-                            value=value,
-                        )
-                    )
+            # Cała strona dokładana jednym wywołaniem extend, bez append dla każdego rekordu
+            result.extend(
+                models.SensorData(parse_datetime(entry["Data"]), value)
+                for entry in data
+                if (value := entry.get("Wartość")) is not None
+            )
 
         self._get_each(
             endpoint=f"pjp-api/v1/rest/data/getData/{sensor_id}",
@@ -369,13 +510,10 @@ class Client:
             params["dayNumber"] = days
 
         def collect(data: list[dict[str, Any]]) -> None:
-            for entry in data:
-                result.append(
-                    models.SensorData(
-                        date=datetime.fromisoformat(entry["Data"]),
-                        value=entry.get("Wartość"),
-                    )
-                )
+            result.extend(
+                models.SensorData(parse_datetime(entry["Data"]), entry.get("Wartość"))
+                for entry in data
+            )
 
         try:
             self._get_each(
@@ -383,6 +521,9 @@ class Client:
                 target="Lista archiwalnych wyników pomiarów",
                 callback=collect,
                 args=params,
+                # Endpoint danych archiwalnych ma limit żądań - seria równoległych
+                # zapytań o kolejne strony mogłaby go przekroczyć w połowie zakresu
+                sequential=True,
             )
         except APIError as e:
             match e.code:
@@ -6,7 +6,7 @@ from dataclasses import dataclass
 from datetime import datetime
 
 
-@dataclass
+@dataclass(slots=True)
 class Station:
     id: int
     codename: str
@@ -18,7 +18,7 @@ class Station:
     latitude: float
     longitude: float
 
-@dataclass
+@dataclass(slots=True)
 class StationMeta:
     codename: str
     international_codename: str | None
@@ -26,30 +26,30 @@ class StationMeta:
     close_date: datetime | None
     type: str
 
-@dataclass
+@dataclass(slots=True)
 class IndexCategory:
     value: int
     name: str
 
-@dataclass
+@dataclass(slots=True)
 class Index:
     date: datetime | None
     value: int | None
 
-@dataclass
+@dataclass(slots=True)
 class AirQualityIndexes:
     overall: Index
     sensors: dict[str,Index]
     index_status: bool | None
     index_critical: str | None
 
-@dataclass
+@dataclass(slots=True)
 class Sensor:
     id: int
     codename: str
     name: str
 
-@dataclass
+@dataclass(slots=True)
 class SensorData:
     date: datetime
     value: float
\ No newline at end of file
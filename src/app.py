@@ -1,14 +1,19 @@
+from typing import TYPE_CHECKING
+
 from PySide6.QtCore import Slot, Signal
 from PySide6.QtWidgets import QApplication, QDialog, QVBoxLayout  # Biblioteka graficzna
 
-from gui.station_details import StationDetailsWidget
 from gui.station_select import StationSelectWidget
 from repository import Repository
 
+# Widok szczegółów (QtCharts, numpy) importowany jest dopiero przy otwarciu pierwszej stacji
+if TYPE_CHECKING:
+    from gui.station_details import StationDetailsWidget
+
 
 class Application(QApplication):
     station_select: StationSelectWidget
-    station_details: StationDetailsWidget
+    station_details: 'StationDetailsWidget'
 
     api_connection_status_changed = Signal(bool)
 
@@ -31,6 +36,8 @@ class Application(QApplication):
 
     @Slot(int)
     def open_station_details(self,station_id: int):
+        from gui.station_details import StationDetailsWidget
+
         dialog = QDialog(self.station_select)
         dialog.setModal(True)
         layout = QVBoxLayout(dialog)
@@ -24,6 +24,20 @@ AQ_INDEX_CATEGORIES_COLORS = {
      4: 0xCC0033,  # Bardzo zły – czerwień
 }
 
+# Kolory kategorii jako tablica indeksowana wartością indeksu przesuniętą o 1 (dla -1)
+AQ_INDEX_CATEGORIES_COLORS_LUT = tuple(
+    AQ_INDEX_CATEGORIES_COLORS[value]
+    for value in range(-1, max(AQ_INDEX_CATEGORIES_COLORS) + 1)
+)
+
+
+def aq_index_color(value: int) -> int:
+    """Zwraca kolor kategorii indeksu jakości powietrza lub 0 dla wartości spoza skali."""
+    index = value + 1
+    if 0 <= index < len(AQ_INDEX_CATEGORIES_COLORS_LUT):
+        return AQ_INDEX_CATEGORIES_COLORS_LUT[index]
+    return 0
+
 
 AQ_TYPES = [
     "Ogólny",
@@ -1,16 +1,73 @@
 import os
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 from enum import Enum
-from typing import Iterable, List, Optional
+from operator import itemgetter
+from typing import Iterable, Iterator, List, Optional, TYPE_CHECKING
+
+import numpy as np
 
-import src.api.models as api_models
 import src.config as config
 import src.database.views as views
 
+# Modele API są potrzebne tylko w adnotacjach typów
+if TYPE_CHECKING:
+    import src.api.models as api_models
+
 
 OVERALL_SENSOR_TYPE_CODENAME: str = "Ogólny"
 
+# Najczęściej wykonywane zapytania; ten sam tekst SQL trafia do cache przygotowanych instrukcji sqlite3
+_SELECT_GLOBAL_UPDATE = "SELECT last_update_at FROM global_update WHERE id = ?"
+_SELECT_LAST_SENSORS_UPDATE = "SELECT last_sensors_update_at FROM station_update WHERE station_id = ?"
+_SELECT_LAST_INDEXES_UPDATE = "SELECT last_indexes_update_at FROM station_update WHERE station_id = ?"
+_SELECT_LAST_META_UPDATE = "SELECT last_meta_update_at FROM station_update WHERE station_id = ?"
+_SELECT_AQ_INDEX_VALUE = "SELECT value FROM aq_index WHERE station_id = ? AND sensor_type_id = ?"
+_SELECT_LATEST_SENSOR_DATE = "SELECT MAX(date) AS dt FROM sensor_data WHERE sensor_id = ?"
+_SELECT_OLDEST_SENSOR_DATE = "SELECT MIN(date) AS dt FROM sensor_data WHERE sensor_id = ?"
+_SELECT_SENSOR_DATA_SINCE = """
+    SELECT date, value FROM sensor_data
+    WHERE sensor_id = ? AND date >= ?
+    ORDER BY date
+"""
+_SELECT_SENSOR_DATA_BETWEEN = """
+    SELECT date, value FROM sensor_data
+    WHERE sensor_id = ? AND date >= ? AND date <= ?
+    ORDER BY date
+"""
+
+# Liczba wierszy wstawianych jednym poleceniem INSERT (3 parametry na wiersz)
+_SENSOR_DATA_ROWS_PER_INSERT = 250
+
+
+def _upsert_sensor_data_sql(rows: int) -> str:
+    """Zwraca polecenie wstawiające `rows` pomiarów jednym wieloelementowym VALUES."""
+    return (
+        "INSERT INTO sensor_data (sensor_id, date, value) VALUES "
+        + ", ".join(("(?, ?, ?)",) * rows)
+        + " ON CONFLICT(sensor_id, date) DO UPDATE SET value = EXCLUDED.value"
+    )
+
+
+_UPSERT_SENSOR_DATA_CHUNK = _upsert_sensor_data_sql(_SENSOR_DATA_ROWS_PER_INSERT)
+
+# Górna granica parametrów w jednym IN (...), poniżej limitu starszych wersji SQLite (999)
+_MAX_IN_PARAMS = 500
+
+
+def _placeholders(count: int) -> str:
+    """Zwraca listę `count` znaków zapytania do klauzuli IN."""
+    return ", ".join("?" * count)
+
+
+def _chunks(items: List[int], size: int) -> Iterator[List[int]]:
+    """Dzieli listę na kolejne fragmenty o długości co najwyżej `size`."""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
 
 class Client:
     """
@@ -24,21 +81,45 @@ class Client:
         """Identyfikatory typów globalnych aktualizacji."""
         STATION_LIST = 0
 
-    def __init__(self, database_filepath: str):
+    def __init__(
+        self,
+        database_filepath: str,
+        check_same_thread: bool = True,
+        initialize_schema: bool = True
+    ):
         """
         Inicjalizuje połączenie i ewentualnie wypełnia bazę.
 
         Args:
             database_filepath: ścieżka do pliku SQLite.
+            check_same_thread: czy sqlite3 ma pilnować użycia połączenia tylko w wątku,
+                w którym zostało otwarte (wyłączane dla klientów z ClientPool).
+            initialize_schema: czy utworzyć i zmigrować schemat; wyłączane dla klientów
+                z ClientPool, bo schemat przygotował już klient, z którego powstała pula.
         """
         needs_populate = not os.path.exists(database_filepath)
         self._filepath = database_filepath
-        self._conn = sqlite3.connect(database_filepath)
-        self._conn.row_factory = sqlite3.Row
+        # Autocommit; transakcje otwierane są jawnie przez transaction()
+        self._conn = sqlite3.connect(
+            database_filepath,
+            isolation_level=None,
+            check_same_thread=check_same_thread,
+            cached_statements=256
+        )
         self._cursor = self._conn.cursor()
-
-        if needs_populate:
-            self._populate_tables()
+        self._configure_connection()
+        # codename -> id typu sensora; typy nie są usuwane, więc wystarczy doładować przy braku
+        self._sensor_type_ids: dict[str, int] = {}
+        # widoki stacji zapamiętane dla wartości global_update.last_update_at, przy której je odczytano
+        self._station_views_version: Optional[int] = None
+        self._station_list_memo: Optional[List[views.StationListView]] = None
+        self._station_details_memo: dict[int, views.StationDetailsView] = {}
+
+        if initialize_schema:
+            with self.transaction():
+                if needs_populate:
+                    self._populate_tables()
+                self._migrate_tables()
 
     def __del__(self):
         """Zamyka kursor i połączenie przy usunięciu instancji."""
@@ -48,12 +129,51 @@ class Client:
         except Exception:
             pass
 
-    def duplicate_connection(self) -> 'Client':
-        """Zwraca nową instancję Client na tym samym pliku bazy."""
-        return Client(self._filepath)
+    def _configure_connection(self) -> None:
+        """
+        Ustawia parametry połączenia: WAL, synchronous=NORMAL, większy cache i mmap.
+
+        Tryb WAL jest trwały (zapisany w pliku bazy), więc przełączany jest tylko,
+        gdy baza jeszcze z niego nie korzysta. Klucze obce pozostają wyłączone,
+        bo INSERT OR REPLACE na station naruszałby odwołania z station_update.
+        """
+        journal_mode = self._conn.execute("PRAGMA journal_mode").fetchone()[0]
+        if journal_mode.lower() != "wal":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA temp_store=MEMORY")
+        self._conn.execute("PRAGMA cache_size=-64000")
+        self._conn.execute("PRAGMA mmap_size=268435456")
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """
+        Wykonuje blok w jednej transakcji (BEGIN IMMEDIATE ... COMMIT), wycofywanej w razie wyjątku.
+
+        Wywołanie wewnątrz już otwartej transakcji dołącza do niej, dzięki czemu kilka
+        aktualizacji może zostać zatwierdzonych jednym zapisem na dysk.
+        """
+        if self._conn.in_transaction:
+            yield
+            return
+
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._conn.rollback()
+            # wycofane id typów mogą zostać ponownie przydzielone innym kodom
+            self._sensor_type_ids.clear()
+            raise
+        self._conn.commit()
+
+    def create_pool(self, max_size: int = 4) -> 'ClientPool':
+        """Zwraca pulę połączeń do tego samego pliku bazy, do użytku z wątków roboczych."""
+        # schemat został już przygotowany przez tego klienta
+        return ClientPool(self._filepath, max_size, initialize_schema=False)
 
     def _populate_tables(self) -> None:
-        """Tworzy wszystkie tabele, triggery i dane początkowe."""
+        """Tworzy wszystkie tabele i dane początkowe."""
         # global_update
         self._cursor.execute("""
             CREATE TABLE IF NOT EXISTS global_update (
@@ -97,19 +217,8 @@ class Client:
                     ON UPDATE CASCADE
             )
         """)
-        # triggery dla station
-        for evt in ("INSERT", "UPDATE"):
-            self._cursor.execute(f"""
-                CREATE TRIGGER IF NOT EXISTS tgr_on_{evt.lower()}_station
-                AFTER {evt} ON station
-                BEGIN
-                    UPDATE global_update
-                    SET last_update_at = unixepoch('now')
-                    WHERE id = {self.GlobalUpdateIds.STATION_LIST.value};
-                END
-            """)
 
-        # station_meta + triggery
+        # station_meta
         self._cursor.execute("""
             CREATE TABLE IF NOT EXISTS station_meta (
                 station_id INTEGER NOT NULL,
@@ -121,17 +230,6 @@ class Client:
                     ON UPDATE CASCADE
             )
         """)
-        for evt in ("INSERT", "UPDATE"):
-            self._cursor.execute(f"""
-                CREATE TRIGGER IF NOT EXISTS tgr_on_{evt.lower()}_station_meta
-                AFTER {evt} ON station_meta
-                FOR EACH ROW
-                BEGIN
-                    INSERT OR REPLACE INTO station_update
-                    (station_id, last_meta_update_at)
-                    VALUES (NEW.station_id, unixepoch('now'));
-                END
-            """)
 
         # kategorie indeksów
         self._cursor.execute("""
@@ -157,76 +255,115 @@ class Client:
             ((t,) for t in config.AQ_TYPES)
         )
 
-        # aq_index + triggery
+        # aq_index
+        self._create_aq_index_table()
+
+        # sensor
         self._cursor.execute("""
-            CREATE TABLE IF NOT EXISTS aq_index (
+            CREATE TABLE IF NOT EXISTS sensor (
+                id INTEGER PRIMARY KEY,
                 station_id INTEGER,
                 sensor_type_id INTEGER,
-                value INTEGER,
-                record_date TEXT,
-                PRIMARY KEY(station_id, sensor_type_id),
                 FOREIGN KEY(station_id) REFERENCES station(id)
                     ON UPDATE CASCADE,
-                FOREIGN KEY(sensor_type_id) REFERENCES sensor_type(id),
-                FOREIGN KEY(value) REFERENCES aq_index_category_name(value)
+                FOREIGN KEY(sensor_type_id) REFERENCES sensor_type(id)
             )
         """)
-        for evt in ("INSERT", "UPDATE"):
-            self._cursor.execute(f"""
-                CREATE TRIGGER IF NOT EXISTS tgr_on_{evt.lower()}_aq_index
-                AFTER {evt} ON aq_index
-                FOR EACH ROW
-                BEGIN
-                    INSERT INTO station_update
-                      (station_id, last_indexes_update_at)
-                    VALUES
-                      (NEW.station_id, unixepoch('now'))
-                    ON CONFLICT(station_id) DO UPDATE
-                      SET last_indexes_update_at =
-                        EXCLUDED.last_indexes_update_at;
-                END
-            """)
 
-        # sensor + triggery
+        # sensor_data
+        self._create_sensor_data_table()
+
+    def _create_aq_index_table(self) -> None:
+        """Tworzy tabelę aq_index; record_date to czas unix w sekundach."""
         self._cursor.execute("""
-            CREATE TABLE IF NOT EXISTS sensor (
-                id INTEGER PRIMARY KEY,
+            CREATE TABLE IF NOT EXISTS aq_index (
                 station_id INTEGER,
                 sensor_type_id INTEGER,
+                value INTEGER,
+                record_date INTEGER,
+                PRIMARY KEY(station_id, sensor_type_id),
                 FOREIGN KEY(station_id) REFERENCES station(id)
                     ON UPDATE CASCADE,
-                FOREIGN KEY(sensor_type_id) REFERENCES sensor_type(id)
+                FOREIGN KEY(sensor_type_id) REFERENCES sensor_type(id),
+                FOREIGN KEY(value) REFERENCES aq_index_category_name(value)
             )
         """)
-        for evt in ("INSERT", "UPDATE"):
-            self._cursor.execute(f"""
-                CREATE TRIGGER IF NOT EXISTS tgr_on_{evt.lower()}_sensor
-                AFTER {evt} ON sensor
-                FOR EACH ROW
-                BEGIN
-                    INSERT INTO station_update
-                      (station_id, last_sensors_update_at)
-                    VALUES
-                      (NEW.station_id, unixepoch('now'))
-                    ON CONFLICT(station_id) DO UPDATE
-                      SET last_sensors_update_at =
-                        EXCLUDED.last_sensors_update_at;
-                END
-            """)
 
-        # sensor_data
+    def _create_sensor_data_table(self) -> None:
+        """Tworzy tabelę sensor_data; date to czas unix w sekundach."""
         self._cursor.execute("""
             CREATE TABLE IF NOT EXISTS sensor_data (
                 sensor_id INTEGER NOT NULL,
-                date TEXT NOT NULL,
+                date INTEGER NOT NULL,
                 value REAL NOT NULL,
                 PRIMARY KEY(sensor_id, date),
                 FOREIGN KEY(sensor_id) REFERENCES sensor(id)
             )
         """)
-        self._conn.commit()
 
-    def update_stations(self, stations: Iterable[api_models.Station]) -> None:
+    def _migrate_tables(self) -> None:
+        """
+        Doprowadza istniejącą bazę do aktualnego schematu; wykonywane przy każdym otwarciu.
+
+        Klucze główne i ograniczenia UNIQUE (station_update.station_id, aq_index,
+        sensor_data(sensor_id, date)) już indeksują pozostałe częste wyszukiwania,
+        brakuje jedynie indeksu sensorów po stacji.
+
+        Czasy aktualizacji są zapisywane przez metody update_*, więc dawne triggery są usuwane.
+        Daty zapisane jako tekst ISO (czas lokalny) są przepisywane na czas unix w sekundach.
+        """
+        self._cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_sensor_station_id ON sensor (station_id)"
+        )
+        for table in ("station", "station_meta", "aq_index", "sensor"):
+            for evt in ("insert", "update"):
+                self._cursor.execute(f"DROP TRIGGER IF EXISTS tgr_on_{evt}_{table}")
+
+        if self._column_type("sensor_data", "date") == "TEXT":
+            self._cursor.execute("ALTER TABLE sensor_data RENAME TO sensor_data_text")
+            self._create_sensor_data_table()
+            self._cursor.execute("""
+                INSERT OR REPLACE INTO sensor_data (sensor_id, date, value)
+                SELECT sensor_id, unixepoch(date, 'utc'), value FROM sensor_data_text
+            """)
+            self._cursor.execute("DROP TABLE sensor_data_text")
+
+        if self._column_type("aq_index", "record_date") == "TEXT":
+            self._cursor.execute("ALTER TABLE aq_index RENAME TO aq_index_text")
+            self._create_aq_index_table()
+            self._cursor.execute("""
+                INSERT INTO aq_index (station_id, sensor_type_id, value, record_date)
+                SELECT station_id, sensor_type_id, value, unixepoch(record_date, 'utc')
+                FROM aq_index_text
+            """)
+            self._cursor.execute("DROP TABLE aq_index_text")
+
+    def _column_type(self, table: str, column: str) -> Optional[str]:
+        """Zwraca zadeklarowany typ kolumny tabeli lub None, jeśli kolumna nie istnieje."""
+        for _, name, declared_type, *_ in self._cursor.execute(f"PRAGMA table_info({table})").fetchall():
+            if name == column:
+                return declared_type.upper()
+        return None
+
+    def _touch_station_update(self, column: str, station_ids: Iterable) -> None:
+        """
+        Ustawia czas ostatniej aktualizacji (kolumna tabeli station_update) na teraz.
+
+        Args:
+            column: nazwa kolumny last_*_update_at.
+            station_ids: id stacji, których dotyczyła aktualizacja.
+        """
+        self._cursor.executemany(
+            f"""
+            INSERT INTO station_update (station_id, {column})
+            VALUES (?, unixepoch('now'))
+            ON CONFLICT(station_id) DO UPDATE
+              SET {column} = EXCLUDED.{column}
+            """,
+            [(station_id,) for station_id in set(station_ids)]
+        )
+
+    def update_stations(self, stations: Iterable['api_models.Station']) -> None:
         """
         Wstawia lub aktualizuje liste stacji i odpowiadające miasta.
 
@@ -236,68 +373,71 @@ class Client:
         # dodaj/ignoruj miasta
         city_params = ((s.district, s.voivodeship, s.city)
                        for s in stations)
-        self._cursor.executemany(
-            "INSERT OR IGNORE INTO city (district, voivodeship, city) VALUES (?, ?, ?)",
-            city_params
-        )
-        # dodaj/aktualizuj stacje
-        station_params = [
-            {
-                "id": s.id,
-                "codename": s.codename,
-                "name": s.name,
-                "address": s.address,
-                "latitude": s.latitude,
-                "longitude": s.longitude,
-                "city": s.city
-            }
-            for s in stations
-        ]
-        self._cursor.executemany(
-            """
-            INSERT OR REPLACE INTO station
-              (id, codename, name, city_id, address, latitude, longitude)
-            SELECT
-              :id, :codename, :name, city.id, :address, :latitude, :longitude
-            FROM city WHERE city.city = :city
-            """,
-            station_params
-        )
-        self._conn.commit()
+        with self.transaction():
+            self._cursor.executemany(
+                "INSERT OR IGNORE INTO city (district, voivodeship, city) VALUES (?, ?, ?)",
+                city_params
+            )
+            city_ids = dict(self._cursor.execute("SELECT city, id FROM city"))
+            # dodaj/aktualizuj stacje
+            self._cursor.executemany(
+                """
+                INSERT OR REPLACE INTO station
+                  (id, codename, name, city_id, address, latitude, longitude)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                # stacje bez wiersza miasta są pomijane, tak jak przy dawnym złączeniu z tabelą city
+                [(s.id, s.codename, s.name, city_id, s.address, s.latitude, s.longitude)
+                 for s in stations
+                 if (city_id := city_ids.get(s.city)) is not None]
+            )
+            self._cursor.execute(
+                "UPDATE global_update SET last_update_at = unixepoch('now') WHERE id = ?",
+                (self.GlobalUpdateIds.STATION_LIST.value,)
+            )
+            # znacznik ma rozdzielczość sekundy, więc nie polegaj na nim przy własnym zapisie
+            self._station_views_version = None
 
     def get_last_stations_update(self) -> datetime:
         """Zwraca czas ostatniej aktualizacji listy stacji."""
         row = self._cursor.execute(
-            "SELECT last_update_at FROM global_update WHERE id = ?",
+            _SELECT_GLOBAL_UPDATE,
             (self.GlobalUpdateIds.STATION_LIST.value,)
         ).fetchone()
-        return datetime.fromtimestamp(row["last_update_at"])
+        return datetime.fromtimestamp(row[0])
+
+    def _validate_station_views_memo(self) -> None:
+        """Czyści zapamiętane widoki stacji, jeśli lista stacji zmieniła się od ich odczytu."""
+        version = self._cursor.execute(
+            _SELECT_GLOBAL_UPDATE,
+            (self.GlobalUpdateIds.STATION_LIST.value,)
+        ).fetchone()[0]
+        if version != self._station_views_version:
+            self._station_views_version = version
+            self._station_list_memo = None
+            self._station_details_memo.clear()
 
     def get_station_list_view(self) -> List[views.StationListView]:
         """Zwraca listę stacji (id, nazwa, współrzędne, miasto)."""
-        rows = self._cursor.execute("""
-            SELECT s.id, s.name, s.latitude, s.longitude, c.city
-            FROM station AS s
-            JOIN city AS c ON c.id = s.city_id
-        """).fetchall()
-        return [
-            views.StationListView(
-                id=r["id"],
-                name=r["name"],
-                latitude=r["latitude"],
-                longitude=r["longitude"],
-                city=r["city"]
-            ) for r in rows
-        ]
-
-    def update_station_meta(self, meta: List[api_models.StationMeta]) -> None:
+        self._validate_station_views_memo()
+        if self._station_list_memo is None:
+            rows = self._cursor.execute("""
+                SELECT s.id, s.name, s.latitude, s.longitude, c.city
+                FROM station AS s
+                JOIN city AS c ON c.id = s.city_id
+            """).fetchall()
+            self._station_list_memo = [views.StationListView(*r) for r in rows]
+        # widoki są niemutowalne, kopiowana jest tylko sama lista
+        return list(self._station_list_memo)
+
+    def update_station_meta(self, meta: List['api_models.StationMeta']) -> None:
         """
         Wstawia lub aktualizuje metadane stacji.
 
         Args:
             meta: lista obiektów StationMeta z API.
         """
-        params = (
+        params = [
             {
                 "station_id": m.codename,
                 "international": m.international_codename,
@@ -305,17 +445,18 @@ class Client:
                 "shutdown_date": m.close_date.isoformat(),
                 "type": m.type
             } for m in meta
-        )
-        self._cursor.executemany(
-            """
-            INSERT OR REPLACE INTO station_meta
-              (station_id, international_codename, launch_date, shutdown_date, type)
-            VALUES (?, ?, ?, ?, ?)
-            """,
-            [(p["station_id"], p["international"], p["launch_date"],
-              p["shutdown_date"], p["type"]) for p in params]
-        )
-        self._conn.commit()
+        ]
+        with self.transaction():
+            self._cursor.executemany(
+                """
+                INSERT OR REPLACE INTO station_meta
+                  (station_id, international_codename, launch_date, shutdown_date, type)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                [(p["station_id"], p["international"], p["launch_date"],
+                  p["shutdown_date"], p["type"]) for p in params]
+            )
+            self._touch_station_update("last_meta_update_at", (p["station_id"] for p in params))
 
     def fetch_last_station_meta_update(self, station_id: int) -> datetime:
         """
@@ -324,11 +465,8 @@ class Client:
         Args:
             station_id: id stacji.
         """
-        row = self._cursor.execute(
-            "SELECT last_meta_update_at FROM station_update WHERE station_id = ?",
-            (station_id,)
-        ).fetchone()
-        return datetime.fromtimestamp(row["last_meta_update_at"])
+        row = self._cursor.execute(_SELECT_LAST_META_UPDATE, (station_id,)).fetchone()
+        return datetime.fromtimestamp(row[0])
 
     def fetch_station_detail_view(
         self, station_id: int
@@ -339,6 +477,11 @@ class Client:
         Args:
             station_id: id stacji.
         """
+        self._validate_station_views_memo()
+        memo = self._station_details_memo.get(station_id)
+        if memo is not None:
+            return memo
+
         r = self._cursor.execute("""
             SELECT s.codename, s.name, c.district, c.voivodeship,
                    c.city, s.address
@@ -346,15 +489,27 @@ class Client:
             JOIN city AS c ON s.city_id = c.id
             WHERE s.id = ?
         """, (station_id,)).fetchone()
-        return views.StationDetailsView(
+        view = self._station_details_memo[station_id] = views.StationDetailsView(
             id=station_id,
-            codename=r["codename"],
-            name=r["name"],
-            district=r["district"],
-            voivodeship=r["voivodeship"],
-            city=r["city"],
-            address=r["address"]
+            codename=r[0],
+            name=r[1],
+            district=r[2],
+            voivodeship=r[3],
+            city=r[4],
+            address=r[5]
         )
+        return view
+
+    def _resolve_sensor_type_ids(self, codenames: Iterable[str]) -> dict[str, int]:
+        """
+        Zwraca mapę kod -> id typu sensora, doładowując ją z bazy, jeśli brakuje któregoś z kodów.
+
+        Args:
+            codenames: kody, które powinny znaleźć się w mapie.
+        """
+        if any(c not in self._sensor_type_ids for c in codenames):
+            self._sensor_type_ids = dict(self._cursor.execute("SELECT codename, id FROM sensor_type"))
+        return self._sensor_type_ids
 
     def update_sensor_types(self, types: List[str]) -> None:
         """
@@ -364,14 +519,14 @@ class Client:
             types: lista kodów sensorów.
         """
         params = ((t,) for t in types)
-        self._cursor.executemany(
-            "INSERT OR IGNORE INTO sensor_type (codename) VALUES (?)",
-            params
-        )
-        self._conn.commit()
+        with self.transaction():
+            self._cursor.executemany(
+                "INSERT OR IGNORE INTO sensor_type (codename) VALUES (?)",
+                params
+            )
 
     def update_station_air_quality_indexes(
-        self, station_id: int, indexes: api_models.AirQualityIndexes
+        self, station_id: int, indexes: 'api_models.AirQualityIndexes'
     ) -> None:
         """
         Wstawia lub aktualizuje indeksy jakości powietrza.
@@ -382,33 +537,28 @@ class Client:
         """
         all_idxs = ((OVERALL_SENSOR_TYPE_CODENAME, indexes.overall),
                     *indexes.sensors.items())
-        params = (
-            {
-                "station_id": station_id,
-                "codename": key,
-                "value": idx.value,
-                "date": (idx.date.isoformat()
-                         if idx.date else None)
-            } for key, idx in all_idxs
-        )
-        self._cursor.executemany(
-            """
-            INSERT INTO aq_index
-              (station_id, sensor_type_id, value, record_date)
-            VALUES
-              (
-                :station_id,
-                (SELECT id FROM sensor_type WHERE codename = :codename),
-                :value,
-                :date
-              )
-            ON CONFLICT(station_id, sensor_type_id) DO UPDATE
-              SET value = EXCLUDED.value,
-                  record_date = EXCLUDED.record_date
-            """,
-            params
-        )
-        self._conn.commit()
+        type_ids = self._resolve_sensor_type_ids(key for key, _ in all_idxs)
+        params = [
+            (
+                station_id,
+                type_ids.get(key),
+                idx.value,
+                int(idx.date.timestamp()) if idx.date else None
+            ) for key, idx in all_idxs
+        ]
+        with self.transaction():
+            self._cursor.executemany(
+                """
+                INSERT INTO aq_index
+                  (station_id, sensor_type_id, value, record_date)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(station_id, sensor_type_id) DO UPDATE
+                  SET value = EXCLUDED.value,
+                      record_date = EXCLUDED.record_date
+                """,
+                params
+            )
+            self._touch_station_update("last_indexes_update_at", (station_id,))
 
     def fetch_last_station_air_quality_indexes_update(
         self, station_id: int
@@ -419,14 +569,57 @@ class Client:
         Args:
             station_id: id stacji.
         """
-        row = self._cursor.execute(
-            "SELECT last_indexes_update_at FROM station_update "
-            "WHERE station_id = ?",
-            (station_id,)
-        ).fetchone()
-        return (datetime.fromtimestamp(row["last_indexes_update_at"])
+        row = self._cursor.execute(_SELECT_LAST_INDEXES_UPDATE, (station_id,)).fetchone()
+        return (datetime.fromtimestamp(row[0])
                 if row else datetime.fromtimestamp(0))
 
+    def fetch_last_station_air_quality_indexes_updates(
+        self, station_ids: List[int]
+    ) -> dict[int, datetime]:
+        """
+        Zwraca datetime ostatniej aktualizacji indeksów dla wielu stacji naraz.
+
+        Args:
+            station_ids: id stacji; stacje bez wpisu dostają datę 0 (epoka).
+        """
+        epoch = datetime.fromtimestamp(0)
+        updates = dict.fromkeys(station_ids, epoch)
+        for chunk in _chunks(station_ids, _MAX_IN_PARAMS):
+            rows = self._cursor.execute(
+                "SELECT station_id, last_indexes_update_at FROM station_update"
+                f" WHERE station_id IN ({_placeholders(len(chunk))})",
+                chunk
+            )
+            for station_id, timestamp in rows:
+                updates[station_id] = datetime.fromtimestamp(timestamp)
+        return updates
+
+    def fetch_station_air_quality_index_values(
+        self, station_ids: List[int], type_codename: str
+    ) -> dict[int, int]:
+        """
+        Zwraca wartości indeksu danego typu dla wielu stacji jednym zapytaniem na partię.
+
+        Args:
+            station_ids: id stacji.
+            type_codename: kod sensora.
+
+        Returns:
+            Mapa station_id -> wartość; stacje bez indeksu są pomijane.
+        """
+        type_id = self._resolve_sensor_type_ids((type_codename,)).get(type_codename)
+        if type_id is None:
+            return {}
+
+        values: dict[int, int] = {}
+        for chunk in _chunks(station_ids, _MAX_IN_PARAMS):
+            values.update(self._cursor.execute(
+                "SELECT station_id, value FROM aq_index"
+                f" WHERE sensor_type_id = ? AND station_id IN ({_placeholders(len(chunk))})",
+                (type_id, *chunk)
+            ))
+        return values
+
     def fetch_station_air_quality_index_value(
         self, station_id: int, type_codename: str
     ) -> Optional[int]:
@@ -437,18 +630,15 @@ class Client:
             station_id: id stacji.
             type_codename: kod sensora.
         """
-        row = self._cursor.execute("""
-            SELECT aq.value
-            FROM aq_index AS aq
-            JOIN sensor_type AS st
-              ON aq.sensor_type_id = st.id
-            WHERE aq.station_id = :sid
-              AND st.codename = :cod
-        """, {"sid": station_id, "cod": type_codename}).fetchone()
-        return row["value"] if row else None
+        type_id = self._resolve_sensor_type_ids((type_codename,)).get(type_codename)
+        if type_id is None:
+            return None
+
+        row = self._cursor.execute(_SELECT_AQ_INDEX_VALUE, (station_id, type_id)).fetchone()
+        return row[0] if row else None
 
     def update_station_sensors(
-        self, station_id: int, sensors: List[api_models.Sensor]
+        self, station_id: int, sensors: List['api_models.Sensor']
     ) -> None:
         """
         Wstawia nowe sensory do stacji.
@@ -457,28 +647,19 @@ class Client:
             station_id: id stacji.
             sensors: lista obiektów Sensor.
         """
-        self.update_sensor_types([s.codename for s in sensors])
-        params = (
-            {
-                "id": s.id,
-                "station_id": station_id,
-                "codename": s.codename
-            } for s in sensors
-        )
-        self._cursor.executemany(
-            """
-            INSERT OR IGNORE INTO sensor
-              (id, station_id, sensor_type_id)
-            VALUES
-              (
-                :id,
-                :station_id,
-                (SELECT id FROM sensor_type WHERE codename = :codename)
-              )
-            """,
-            params
-        )
-        self._conn.commit()
+        with self.transaction():
+            codenames = [s.codename for s in sensors]
+            self.update_sensor_types(codenames)
+            type_ids = self._resolve_sensor_type_ids(codenames)
+            self._cursor.executemany(
+                """
+                INSERT OR IGNORE INTO sensor
+                  (id, station_id, sensor_type_id)
+                VALUES (?, ?, ?)
+                """,
+                [(s.id, station_id, type_ids[s.codename]) for s in sensors]
+            )
+            self._touch_station_update("last_sensors_update_at", (station_id,))
 
     def fetch_last_station_sensors_update(
         self, station_id: int
@@ -489,12 +670,8 @@ class Client:
         Args:
             station_id: id stacji.
         """
-        row = self._cursor.execute(
-            "SELECT last_sensors_update_at FROM station_update "
-            "WHERE station_id = ?",
-            (station_id,)
-        ).fetchone()
-        return (datetime.fromtimestamp(row["last_sensors_update_at"])
+        row = self._cursor.execute(_SELECT_LAST_SENSORS_UPDATE, (station_id,)).fetchone()
+        return (datetime.fromtimestamp(row[0])
                 if row else datetime.fromtimestamp(0))
 
     def fetch_station_sensors(
@@ -513,12 +690,12 @@ class Client:
             WHERE s.station_id = ?
         """, (station_id,)).fetchall()
         return [
-            views.SensorView(id=r["id"], codename=r["codename"])
+            views.SensorView(*r)
             for r in rows
         ]
 
     def update_sensor_data(
-        self, sensor_id: int, data: List[api_models.SensorData]
+        self, sensor_id: int, data: List['api_models.SensorData']
     ) -> None:
         """
         Wstawia lub aktualizuje pomiary z sensora.
@@ -527,17 +704,21 @@ class Client:
             sensor_id: id sensora.
             data: lista obiektów SensorData.
         """
-        params = [
-            (sensor_id, entry.date.isoformat(), entry.value)
-            for entry in data
-        ]
-        self._cursor.executemany("""
-            INSERT INTO sensor_data (sensor_id, date, value)
-            VALUES (?, ?, ?)
-            ON CONFLICT(sensor_id, date) DO UPDATE
-              SET value = EXCLUDED.value
-        """, params)
-        self._conn.commit()
+        # API zwraca pomiary od najnowszych; wstawianie w kolejności klucza (sensor_id, date)
+        # dopisuje wiersze na końcu B-drzewa zamiast dzielić strony w środku
+        rows = sorted(
+            ((int(entry.date.timestamp()), entry.value) for entry in data),
+            key=itemgetter(0)
+        )
+        params = [p for date, value in rows for p in (sensor_id, date, value)]
+        chunk = 3 * _SENSOR_DATA_ROWS_PER_INSERT
+        full = len(params) - len(params) % chunk
+        with self.transaction():
+            for start in range(0, full, chunk):
+                self._cursor.execute(_UPSERT_SENSOR_DATA_CHUNK, params[start:start + chunk])
+            if full < len(params):
+                tail = params[full:]
+                self._cursor.execute(_upsert_sensor_data_sql(len(tail) // 3), tail)
 
     def fetch_latest_sensor_record_date(
         self, sensor_id: int
@@ -548,12 +729,9 @@ class Client:
         Args:
             sensor_id: id sensora.
         """
-        row = self._cursor.execute("""
-            SELECT MAX(date) AS dt FROM sensor_data
-            WHERE sensor_id = ?
-        """, (sensor_id,)).fetchone()
-        return (datetime.fromisoformat(row["dt"])
-                if row and row["dt"] else None)
+        row = self._cursor.execute(_SELECT_LATEST_SENSOR_DATE, (sensor_id,)).fetchone()
+        return (datetime.fromtimestamp(row[0])
+                if row and row[0] is not None else None)
 
     def fetch_oldest_sensor_record_date(
         self, sensor_id: int
@@ -564,18 +742,33 @@ class Client:
         Args:
             sensor_id: id sensora.
         """
-        row = self._cursor.execute("""
-            SELECT MIN(date) AS dt FROM sensor_data
-            WHERE sensor_id = ?
-        """, (sensor_id,)).fetchone()
-        return (datetime.fromisoformat(row["dt"])
-                if row and row["dt"] else None)
+        row = self._cursor.execute(_SELECT_OLDEST_SENSOR_DATE, (sensor_id,)).fetchone()
+        return (datetime.fromtimestamp(row[0])
+                if row and row[0] is not None else None)
+
+    def _select_sensor_data(
+        self,
+        cursor: sqlite3.Cursor,
+        sensor_id: int,
+        date_from: datetime,
+        date_to: Optional[datetime]
+    ) -> sqlite3.Cursor:
+        """Wykonuje zapytanie o pomiary (date, value) z zakresu; bez date_to - aż do najnowszego."""
+        if date_to is None:
+            return cursor.execute(
+                _SELECT_SENSOR_DATA_SINCE,
+                (sensor_id, int(date_from.timestamp()))
+            )
+        return cursor.execute(
+            _SELECT_SENSOR_DATA_BETWEEN,
+            (sensor_id, int(date_from.timestamp()), int(date_to.timestamp()))
+        )
 
     def fetch_sensor_data(
         self,
         sensor_id: int,
         date_from: datetime,
-        date_to: datetime = datetime.now()
+        date_to: Optional[datetime] = None
     ) -> List[views.SensorValueView]:
         """
         Zwraca pomiary sensora z zakresu dat.
@@ -585,20 +778,124 @@ class Client:
             date_from: początek zakresu.
             date_to: koniec zakresu (domyślnie teraz).
         """
-        rows = self._cursor.execute("""
-            SELECT date, value FROM sensor_data
-            WHERE sensor_id = :sid
-              AND date >= :dfrom
-              AND date <= :dto
-        """, {
-            "sid": sensor_id,
-            "dfrom": date_from.isoformat(),
-            "dto": date_to.isoformat()
-        }).fetchall()
-        return [
-            views.SensorValueView(
-                date=datetime.fromisoformat(r["date"]),
-                value=r["value"]
-            ) for r in rows
-        ]
+        return list(self.iter_sensor_data(sensor_id, date_from, date_to))
+
+    def iter_sensor_data(
+        self,
+        sensor_id: int,
+        date_from: datetime,
+        date_to: Optional[datetime] = None,
+        batch_size: int = 1024
+    ) -> Iterator[views.SensorValueView]:
+        """
+        Zwraca pomiary sensora z zakresu dat jako generator, pobierając wiersze partiami.
+
+        Korzysta z własnego kursora, więc inne zapytania klienta wykonywane w trakcie
+        iteracji jej nie przerywają.
+
+        Args:
+            sensor_id: id sensora.
+            date_from: początek zakresu.
+            date_to: koniec zakresu (domyślnie teraz).
+            batch_size: liczba wierszy pobieranych naraz.
+        """
+        cursor = self._conn.cursor()
+        try:
+            self._select_sensor_data(cursor, sensor_id, date_from, date_to)
+            while batch := cursor.fetchmany(batch_size):
+                for date, value in batch:
+                    yield views.SensorValueView(datetime.fromtimestamp(date), value)
+        finally:
+            cursor.close()
+
+    def fetch_sensor_data_arrays(
+        self,
+        sensor_id: int,
+        date_from: datetime,
+        date_to: Optional[datetime] = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Zwraca pomiary sensora z zakresu dat jako tablice numpy, bez tworzenia obiektów na wiersz.
 
+        Args:
+            sensor_id: id sensora.
+            date_from: początek zakresu.
+            date_to: koniec zakresu (domyślnie teraz).
+
+        Returns:
+            (daty jako datetime64[s] w UTC, wartości jako float64), w kolejności rosnących dat.
+        """
+        rows = self._select_sensor_data(self._cursor, sensor_id, date_from, date_to).fetchall()
+        count = len(rows)
+        dates = np.fromiter((r[0] for r in rows), dtype=np.int64, count=count)
+        values = np.fromiter((r[1] for r in rows), dtype=np.float64, count=count)
+        return dates.view("datetime64[s]"), values
+
+
+class ClientPool:
+    """
+    Pula co najwyżej `max_size` otwartych instancji Client na jednym pliku bazy.
+
+    Połączenia tworzone są leniwie i wielokrotnie wykorzystywane przez kolejne wątki,
+    zamiast otwierać nowe przy każdym zadaniu. Gdy wszystkie są zajęte, acquire() czeka
+    na zwolnienie któregoś z nich.
+    """
+
+    def __init__(self, database_filepath: str, max_size: int = 4, initialize_schema: bool = True):
+        """
+        Args:
+            database_filepath: ścieżka do pliku SQLite.
+            max_size: maksymalna liczba jednocześnie otwartych połączeń.
+            initialize_schema: czy przygotować schemat raz, przy tworzeniu puli; kolejne
+                połączenia z puli go pomijają (zbędna blokada zapisu przy każdym otwarciu).
+        """
+        self._filepath = database_filepath
+        self._max_size = max_size
+        self._idle: queue.LifoQueue[Client] = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+        if initialize_schema:
+            # pierwsze połączenie przygotowuje schemat i od razu trafia do puli
+            self._idle.put(Client(database_filepath, check_same_thread=False))
+            self._created = 1
+
+    @property
+    def max_size(self) -> int:
+        """Maksymalna liczba jednocześnie otwartych połączeń."""
+        return self._max_size
+
+    def _take(self) -> Client:
+        """Zwraca wolnego klienta, w razie potrzeby otwierając nowe połączenie lub czekając."""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_create = self._created < self._max_size
+            if can_create:
+                self._created += 1
+
+        if not can_create:
+            return self._idle.get()
+
+        try:
+            return Client(self._filepath, check_same_thread=False, initialize_schema=False)
+        except BaseException:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def release(self, client: Client) -> None:
+        """Oddaje klienta do puli."""
+        self._idle.put(client)
+
+    @contextmanager
+    def acquire(self) -> Iterator[Client]:
+        """Wypożycza klienta na czas bloku `with` i oddaje go po jego zakończeniu."""
+        client = self._take()
+        try:
+            yield client
+        finally:
+            self.release(client)
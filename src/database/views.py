@@ -6,29 +6,29 @@ Objekty przechowujące dane z bazy danych
 from datetime import datetime
 from dataclasses import dataclass
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class StationCommonView:
     id: int
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class StationListView(StationCommonView):
     name: str
     latitude: float
     longitude: float
     city: str
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class AQIndexView:
     codename: str
     value: int
     category: str
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class SensorView:
     id: int
     codename: str
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class StationDetailsView(StationCommonView):
     codename: str
     name: str
@@ -37,7 +37,7 @@ class StationDetailsView(StationCommonView):
     city: str
     address: str
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class SensorValueView:
     date: datetime
     value: float
\ No newline at end of file
@@ -1,22 +1,57 @@
-from rapidfuzz import process,fuzz
 from typing import Any, Iterable
 
+# rapidfuzz jest importowany dopiero przy pierwszym wyszukiwaniu, nie przy starcie aplikacji
+
 
 def fuzzy_search(
         query: str,
         choice: Iterable[str],
         limit: int | None = None,
-        scorer: Any | None = fuzz.WRatio,
+        scorer: Any | None = None,
         score_cutoff: int | None = None
 ) -> list[str]:
+    from rapidfuzz import process, fuzz
 
     results = process.extract(
         query,
         choice,
         limit=limit,
-        scorer=scorer,
+        scorer=scorer or fuzz.WRatio,
         score_cutoff=score_cutoff
     )
-    results.sort(key=lambda x: x[1],reverse=True)
+    # process.extract zwraca wyniki już posortowane malejąco po wyniku
+
+    return [match for match, score, _ in results]
+
+
+class FuzzyIndex:
+    """
+    Stała lista napisów do wielokrotnego przeszukiwania (np. nazwy stacji przy każdym
+    naciśnięciu klawisza). Napisy są normalizowane (default_process) raz, przy budowie.
+    """
+
+    def __init__(self, choice: Iterable[str], scorer: Any | None = None):
+        from rapidfuzz import process, fuzz
+        from rapidfuzz.utils import default_process
+
+        self._extract = process.extract
+        self._default_process = default_process
+        self._scorer = scorer or fuzz.WRatio
+        self._normed = [default_process(c) for c in choice]
 
-    return [match for match, score, _ in results]
\ No newline at end of file
+    def __call__(
+            self,
+            query: str,
+            limit: int | None = None,
+            score_cutoff: int | None = None
+    ) -> list[int]:
+        """Zwraca indeksy pasujących napisów w kolejności malejącego dopasowania."""
+        results = self._extract(
+            self._default_process(query),
+            self._normed,
+            scorer=self._scorer,
+            processor=None,
+            limit=limit,
+            score_cutoff=score_cutoff
+        )
+        return [index for _, _, index in results]
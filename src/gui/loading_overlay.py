@@ -1,4 +1,4 @@
-from PySide6.QtCore import Qt, QEvent
+from PySide6.QtCore import Qt, QEvent, QTimer
 from PySide6.QtWidgets import QWidget, QLabel, QVBoxLayout, QFrame
 
 
@@ -9,6 +9,7 @@ class LoadingOverlay(QFrame):
         self.setGeometry(0, 0, parent.width(), parent.height())
         self.setStyleSheet("background-color: rgba(0, 0, 0, 100);")
         self.hide()
+        self._resize_pending = False
 
         # Create a layout for the overlay to manage the label
         layout = QVBoxLayout(self)
@@ -25,7 +26,16 @@ class LoadingOverlay(QFrame):
     def eventFilter(self, watched, event):
         parent = self.parent()
         if watched == parent and event.type() == QEvent.Type.Resize:
-            # Update geometry to match parent's new size
-            self.setGeometry(0, 0, parent.width(), parent.height())
+            # Coalesce resize bursts (e.g. window drag) into one geometry update per event loop pass
+            if not self._resize_pending:
+                self._resize_pending = True
+                QTimer.singleShot(0, self._apply_geometry)
             return False
-        return super().eventFilter(watched, event)
\ No newline at end of file
+        return super().eventFilter(watched, event)
+
+    def _apply_geometry(self):
+        self._resize_pending = False
+        parent = self.parentWidget()
+        if parent is not None:
+            # Update geometry to match parent's new size
+            self.setGeometry(0, 0, parent.width(), parent.height())
\ No newline at end of file
@@ -1,10 +1,15 @@
 from PySide6.QtCore import QDateTime
 from datetime import datetime
 
+_from_timestamp = datetime.fromtimestamp
+_from_msecs_since_epoch = QDateTime.fromMSecsSinceEpoch
+
 def qt_to_datetime(dt: QDateTime) -> datetime:
     ms = dt.toMSecsSinceEpoch()
-    return datetime.fromtimestamp(ms / 1000.0)
+    # pełne sekundy (typowe dla QDateTimeEdit) bez dzielenia zmiennoprzecinkowego
+    if ms % 1000 == 0:
+        return _from_timestamp(ms // 1000)
+    return _from_timestamp(ms / 1000.0)
 
 def datetime_to_qt(dt: datetime) -> QDateTime:
-    ms = int(dt.timestamp() * 1000)
-    return QDateTime.fromMSecsSinceEpoch(ms)
+    return _from_msecs_since_epoch(int(dt.timestamp() * 1000))
@@ -1,15 +1,15 @@
+from collections import OrderedDict
 from datetime import datetime
-from typing import Any
 
 import numpy as np
-from PySide6.QtCharts import QChart, QChartView, QValueAxis, QDateTimeAxis, QSplineSeries, QScatterSeries
-from PySide6.QtCore import QDateTime, Slot, QSize, QPointF, QThreadPool, QRunnable, Signal, QObject
+from PySide6.QtCharts import QChart, QChartView, QValueAxis, QDateTimeAxis, QLineSeries, QScatterSeries
+from PySide6.QtCore import QDateTime, Slot, QSize, QPointF, QThreadPool, QRunnable, Signal, QObject, QSignalBlocker
 from PySide6.QtGui import Qt, QPainter, QFont, QColorConstants, QCursor
 from PySide6.QtWidgets import QWidget, QHBoxLayout, QLabel, QTabWidget, QFormLayout, QComboBox, QDateTimeEdit, \
     QVBoxLayout, QPushButton, QMessageBox, QGroupBox, QGridLayout, QToolTip
 
 from src.api.exceptions import TooManyRequests
-from src.database.views import StationDetailsView, SensorView, SensorValueView
+from src.database.views import StationDetailsView, SensorView
 from src.gui.loading_overlay import LoadingOverlay
 from src.gui.qt import qt_to_datetime
 from src.repository import Repository
@@ -36,9 +36,89 @@ class StationInfoWidget(QWidget):
 
         self.setLayout(form)
 
+def _sensor_stats(xs: np.ndarray, ys: np.ndarray) -> tuple[int, int, float, float]:
+    """
+    Liczy (indeks minimum, indeks maksimum, średnią, nachylenie trendu) przy jak najmniejszej
+    liczbie przejść po tablicach.
+
+    Nachylenie m = sum(dx * y) / sum(dx * dx), gdzie dx = x - mean(x); ponieważ sum(dx) = 0,
+    centrowanie y jest zbędne. Centrowanie x zostaje - dla znaczników czasu w ms suma x*x
+    straciłaby całą precyzję float64.
+    """
+    dx = xs - xs.mean()
+    with np.errstate(invalid="ignore", divide="ignore"):
+        slope = np.dot(dx, ys) / np.dot(dx, dx)
+    if not np.isfinite(slope):
+        slope = 0.0
+
+    return int(ys.argmin()), int(ys.argmax()), float(ys.mean()), float(slope)
+
+
+def _m4_indices(xs: np.ndarray, ys: np.ndarray, bins: int) -> np.ndarray:
+    """
+    Agregacja M4: dla każdego z `bins` przedziałów osi X (np. piksela szerokości wykresu)
+    zwraca indeksy pierwszego, ostatniego, najmniejszego i największego punktu.
+    Linia narysowana przez te punkty wygląda tak samo jak przez wszystkie.
+
+    Args:
+        xs: posortowane rosnąco współrzędne X.
+        ys: wartości.
+        bins: liczba przedziałów.
+
+    Returns:
+        Posortowane, unikalne indeksy wybranych punktów.
+    """
+    span = xs[-1] - xs[0]
+    if span <= 0:
+        return np.arange(len(xs))
+
+    bin_ids = ((xs - xs[0]) * (bins / span)).astype(np.int64)
+    np.minimum(bin_ids, bins - 1, out=bin_ids)
+
+    # granice kolejnych niepustych przedziałów (xs, a więc i bin_ids, są posortowane)
+    starts = np.flatnonzero(np.diff(bin_ids, prepend=-1))
+    ends = np.append(starts[1:], len(xs)) - 1
+
+    # w obrębie przedziału posortuj po wartości: pierwszy to minimum, ostatni maksimum
+    by_value = np.lexsort((ys, bin_ids))
+
+    return np.unique(np.concatenate((starts, ends, by_value[starts], by_value[ends])))
+
+
+def _prepare_chart_data(dates: np.ndarray, values: np.ndarray) -> dict | None:
+    """
+    Przygotowuje punkty wykresu i statystyki; wykonywane w wątku roboczym.
+
+    Args:
+        dates: daty pomiarów (datetime64), posortowane rosnąco.
+        values: wartości pomiarów (float64).
+
+    Returns:
+        None przy braku pomiarów, w przeciwnym razie słownik z kluczami:
+        xs (ms od epoki, float64), ys, imin, imax, mean, slope.
+    """
+    if len(values) == 0:
+        return None
+
+    # sekundy -> milisekundy float64 w jednej operacji, bez pośrednich kopii
+    xs = np.multiply(dates.astype("datetime64[s]", copy=False).view(np.int64), 1000, dtype=np.float64)
+    ys = values
+    imin, imax, mean, slope = _sensor_stats(xs, ys)
+
+    return {
+        "xs": xs,
+        "ys": ys,
+        "imin": imin,
+        "imax": imax,
+        "mean": mean,
+        "slope": slope
+    }
+
+
 class SensorDataFetcher(QRunnable):
     class Signals(QObject):
-        finished = Signal(Any)
+        #               (sensor_id, date_from, date_to), chart_data
+        finished = Signal(tuple,object)
         too_many_requests = Signal()
 
     def __init__(self,sensor_id: int,date_from: datetime,date_to: datetime,repository: Repository):
@@ -51,20 +131,27 @@ class SensorDataFetcher(QRunnable):
 
     def run(self):
         try:
-            own_repository = self.repository.clone()
-            data = own_repository.fetch_sensor_data(self.sensor_id,self.date_from,self.date_to)
-            self.signals.finished.emit(data)
+            with self.repository.acquire() as own_repository:
+                dates, values = own_repository.fetch_sensor_data_arrays(self.sensor_id,self.date_from,self.date_to)
+            self.signals.finished.emit(
+                (self.sensor_id, self.date_from, self.date_to),
+                _prepare_chart_data(dates, values)
+            )
         except TooManyRequests as e:
             self.signals.too_many_requests.emit()
 
 
 class StationDataWidget(QWidget):
+    # Ile ostatnio wyświetlonych zakresów (sensor, od, do) trzymać w pamięci
+    CHART_DATA_CACHE_SIZE = 32
 
     def __init__(self,repository: Repository,station_id: int,parent: QWidget = None):
         super().__init__(parent=parent)
         self.setMinimumSize(QSize(700,500))
         self.repository = repository
         self.station_id = station_id
+        self._chart_data_cache: OrderedDict[tuple, dict] = OrderedDict()
+        self._chart_data: dict | None = None
 
         # Sensor select
 
@@ -132,8 +219,8 @@ class StationDataWidget(QWidget):
         self.date_from_edit.setMaximumDateTime(self.date_to_edit.dateTime())
         self.date_to_edit.setMinimumDateTime(self.date_from_edit.dateTime())
 
-        self.date_from_edit.dateTimeChanged.connect(lambda dt: self.date_to_edit.setMinimumDateTime(dt))
-        self.date_to_edit.dateTimeChanged.connect(lambda dt: self.date_from_edit.setMaximumDateTime(dt))
+        self.date_from_edit.dateTimeChanged.connect(self._on_from_changed)
+        self.date_to_edit.dateTimeChanged.connect(self._on_to_changed)
 
 
         display_btn = QPushButton("Wyświetl",self)
@@ -150,14 +237,33 @@ class StationDataWidget(QWidget):
         box.setLayout(sensor_select_layout)
         return box
 
+    @Slot(QDateTime)
+    def _on_from_changed(self, dt: QDateTime):
+        if self.date_to_edit.minimumDateTime() == dt:
+            return
+        # Zmiana granicy nie może z powrotem wywołać aktualizacji drugiego pola
+        with QSignalBlocker(self.date_to_edit):
+            self.date_to_edit.setMinimumDateTime(dt)
+
+    @Slot(QDateTime)
+    def _on_to_changed(self, dt: QDateTime):
+        if self.date_from_edit.maximumDateTime() == dt:
+            return
+        with QSignalBlocker(self.date_from_edit):
+            self.date_from_edit.setMaximumDateTime(dt)
+
     def _build_chart(self):
         # ---------------------------------------------------------
         # 1. Utworzenie wykresu i osi
         # ---------------------------------------------------------
         self.chart = QChart()
         self.chart.legend().setVisible(False)
+        # Bez animacji wykres nie przelicza geometrii serii w kolejnych klatkach
+        self.chart.setAnimationOptions(QChart.AnimationOption.NoAnimation)
 
         self.axis_x = QDateTimeAxis(format="MM-dd hh:mm")
+        # Stała liczba podziałek - etykiety formatowane są tylko dla nich
+        self.axis_x.setTickCount(8)
         self.axis_x.setTitleText("Czas")
         self.axis_x.setTitleVisible(False)
 
@@ -170,9 +276,11 @@ class StationDataWidget(QWidget):
         self.chart.addAxis(self.axis_y, Qt.AlignmentFlag.AlignLeft)
 
         # ---------------------------------------------------------
-        # 2. Główna seria (QSplineSeries)
+        # 2. Główna seria (QLineSeries rysowana przez OpenGL;
+        #    QSplineSeries nie obsługuje akceleracji i przelicza krzywą przy każdym odświeżeniu)
         # ---------------------------------------------------------
-        self.series = QSplineSeries()
+        self.series = QLineSeries()
+        self.series.setUseOpenGL(True)
         self.series.hovered.connect(self._on_point_hovered)
         # 2.1 Dodajemy serię do wykresu
         self.chart.addSeries(self.series)
@@ -302,69 +410,99 @@ class StationDataWidget(QWidget):
         dt_from = qt_to_datetime(self.date_from_edit.dateTime())
         dt_to = qt_to_datetime(self.date_to_edit.dateTime())
 
+        # Zakres wyświetlany niedawno - bez ponownego pobierania
+        cache_key = (current_sensor.id, dt_from, dt_to)
+        cached = self._chart_data_cache.get(cache_key)
+        if cached is not None:
+            self._chart_data_cache.move_to_end(cache_key)
+            self.on_data_load_finished(cached)
+            return
+
         # Rozpoczecie pobierania danych
-        job = SensorDataFetcher(current_sensor.id,dt_from,dt_to,self.repository.clone())
-        job.signals.finished.connect(self.on_data_load_finished)
+        job = SensorDataFetcher(current_sensor.id,dt_from,dt_to,self.repository)
+        job.signals.finished.connect(self.on_data_fetched)
         job.signals.too_many_requests.connect(self.on_too_many_requests)
         thread_pool.start(job)
 
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        # gęstość punktów po redukcji M4 zależy od szerokości wykresu
+        if self._chart_data is not None:
+            self._update_series_points()
+
+    def _update_series_points(self):
+        xs = self._chart_data["xs"]
+        ys = self._chart_data["ys"]
+
+        # więcej niż 4 punkty na piksel nie zmieniają wyglądu linii - wysyłamy tylko punkty M4
+        bins = max(self.chart_view.width(), 1)
+        if len(xs) > 4 * bins:
+            idx = _m4_indices(xs, ys, bins)
+            xs = xs[idx]
+            ys = ys[idx]
+
+        # Wypisanie serii jednym wywołaniem zamiast append() dla każdego punktu
+        self.series.replaceNp(xs, ys)
+
+    def _cache_chart_data(self, key: tuple, chart_data: dict | None):
+        # Brak danych nie jest zapamiętywany - mogą pojawić się przy kolejnej próbie
+        if not chart_data:
+            return
+        self._chart_data_cache[key] = chart_data
+        self._chart_data_cache.move_to_end(key)
+        while len(self._chart_data_cache) > self.CHART_DATA_CACHE_SIZE:
+            self._chart_data_cache.popitem(last=False)
+
+    @Slot(tuple,object)
+    def on_data_fetched(self,cache_key: tuple,chart_data: dict | None):
+        # slot widgetu - pamięć podręczna modyfikowana jest tylko w wątku GUI
+        self._cache_chart_data(cache_key, chart_data)
+        self.on_data_load_finished(chart_data)
+
     @Slot()
-    def on_data_load_finished(self,data: list[SensorValueView]):
+    def on_data_load_finished(self,chart_data: dict | None):
         self.is_loading = False
-        if not data:
+        if not chart_data:
             QMessageBox.information(
                 self, "Brak danych",
                 "Brak dostępnych danych pomiarowych w wybranym zakresie!"
             )
             return
 
-        # Zamiana na (timestamp_ms, value) i sortowanie
-        numeric = sorted(
-            ((int(entry.date.timestamp() * 1000), entry.value) for entry in data),
-            key=lambda v: v[0]
-        )
-        xs, ys = zip(*numeric)
+        # Tablice (timestamp_ms, value) posortowane po czasie, przygotowane w wątku roboczym
+        xs = chart_data["xs"]
+        ys = chart_data["ys"]
+        min_idx = chart_data["imin"]
+        max_idx = chart_data["imax"]
 
         # Ustawienie zakresów osi
         self.axis_x.setRange(
-            QDateTime.fromMSecsSinceEpoch(xs[0]),
-            QDateTime.fromMSecsSinceEpoch(xs[-1])
+            QDateTime.fromMSecsSinceEpoch(int(xs[0])),
+            QDateTime.fromMSecsSinceEpoch(int(xs[-1]))
         )
-        self.axis_y.setRange(0, max(ys) * 1.1)
-
-        # Wypisanie serii
-        self.series.clear()
-        self.min_scatter.clear()
-        self.max_scatter.clear()
+        self.axis_y.setRange(0, ys[max_idx] * 1.1)
 
-        for x, y in numeric:
-            self.series.append(x, y)
+        # Pełne tablice zostają do statystyk i ponownej redukcji przy zmianie rozmiaru
+        self._chart_data = chart_data
+        self._update_series_points()
 
-        # Obliczenie min/max
-        min_idx = ys.index(min(ys))
-        max_idx = ys.index(max(ys))
-        min_ts, min_val = numeric[min_idx]
-        max_ts, max_val = numeric[max_idx]
+        # Min/max
+        min_ts, min_val = int(xs[min_idx]), float(ys[min_idx])
+        max_ts, max_val = int(xs[max_idx]), float(ys[max_idx])
         min_dt = datetime.fromtimestamp(min_ts / 1000)
         max_dt = datetime.fromtimestamp(max_ts / 1000)
 
-        avg_val = np.average(ys)
+        avg_val = chart_data["mean"]
 
         self.min_value_label.setText(f"{min_val:.2f} µg/m³ ({min_dt})")
         self.max_value_label.setText(f"{max_val:.2f} µg/m³ ({max_dt})")
         self.avg_value_label.setText(f"{avg_val:.4f} µg/m³")
 
-        self.min_scatter.append(min_ts, min_val)
-        self.max_scatter.append(max_ts, max_val)
-
-        # Obliczenie trendu (regresja liniowa)
-        # weź czasy jako liczby (timestamp)
-        x = np.array([sv.date.timestamp() for sv in data], dtype=float)
-        y = np.array([sv.value for sv in data], dtype=float)
+        self.min_scatter.replaceNp(xs[min_idx:min_idx + 1], ys[min_idx:min_idx + 1])
+        self.max_scatter.replaceNp(xs[max_idx:max_idx + 1], ys[max_idx:max_idx + 1])
 
-        # y = m * x + b
-        A = np.vstack([x, np.ones_like(x)]).T
-        m, _ = np.linalg.lstsq(A, y, rcond=None)[0]
+        # Trend (regresja liniowa)
+        m = chart_data["slope"]
 
         def trend_str():
             if m > 0:
@@ -462,8 +600,7 @@ class StationDetailsWidget(QTabWidget):
 
         self.addTab(self.station_data_widget,"Dane")
 
-        details = self.repository.fetch_station_details_view(self.station_id)
-        self.station_info_widget = StationInfoWidget(details, parent=self)
+        self.station_info_widget = StationInfoWidget(self.details, parent=self)
         self.addTab(self.station_info_widget,"Informacje")
 
         if not self.station_data_widget.check_sensors_availability():
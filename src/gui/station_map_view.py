@@ -1,18 +1,52 @@
+import logging
 from pathlib import Path
 
+try:
+    # Szybsze kodowanie JSON, jeśli jest dostępne (orjson zwraca bytes)
+    from orjson import dumps as _orjson_dumps
+
+    def json_dumps(obj) -> str:
+        return _orjson_dumps(obj).decode()
+except ImportError:
+    from json import dumps as json_dumps
+
 from PySide6.QtCore import QObject, Slot, QUrl, Signal
 from PySide6.QtWebChannel import QWebChannel
+from PySide6.QtWebEngineCore import QWebEngineProfile, QWebEnginePage
 from PySide6.QtWebEngineWidgets import QWebEngineView
 from PySide6.QtWidgets import QWidget, QHBoxLayout, QLabel, QVBoxLayout
 
-from src.config import AQ_INDEX_CATEGORIES_COLORS, AQ_INDEX_CATEGORIES
+from src.config import AQ_INDEX_CATEGORIES_COLORS, AQ_INDEX_CATEGORIES, aq_index_color
+
+logger = logging.getLogger(__name__)
+
+# Skala kolorów (nazwa kategorii, styl etykiety) posortowana po wartości indeksu - liczona raz
+_COLOR_SCALE = tuple(
+    (AQ_INDEX_CATEGORIES[value], f"background-color: #{color:06x}")
+    for value, color in sorted(AQ_INDEX_CATEGORIES_COLORS.items())
+)
+
+# Wspólny profil z trwałą pamięcią podręczną na dysku, aby leaflet.js i kafelki mapy
+# nie były pobierane ponownie przy każdym otwarciu widoku
+_MAP_PROFILE_STORAGE = Path.home() / ".davinci" / "webcache"
+_map_profile: QWebEngineProfile | None = None
+
+def _get_map_profile() -> QWebEngineProfile:
+    """Zwraca współdzielony profil przeglądarki mapy (tworzony leniwie, po utworzeniu QApplication)."""
+    global _map_profile
+    if _map_profile is None:
+        _map_profile = QWebEngineProfile("davinci-map")
+        _map_profile.setPersistentStoragePath(str(_MAP_PROFILE_STORAGE))
+        _map_profile.setCachePath(str(_MAP_PROFILE_STORAGE / "cache"))
+        _map_profile.setHttpCacheType(QWebEngineProfile.HttpCacheType.DiskHttpCache)
+    return _map_profile
 
 
 class MapViewBackend(QObject):
 
     @Slot(result=int)
     def get_color_by_value(self,scale_id: int) -> int:
-        return AQ_INDEX_CATEGORIES_COLORS.get(scale_id) or 0
+        return aq_index_color(scale_id)
 
     # Python wysyla do mapy
     #               latitude, longitude, id
@@ -21,6 +55,8 @@ class MapViewBackend(QObject):
     resetIndexes = Signal()
     #                   station_id, index_value
     initIndexValue = Signal(int, int)
+    #                    station_ids, index_values
+    initIndexValues = Signal(list, list)
 
     # Mapa wysyla do pythona
     stationSelected = Signal(int)
@@ -28,11 +64,17 @@ class MapViewBackend(QObject):
     def on_station_selected(self,station_id: int):
         self.stationSelected.emit(station_id)
 
-    requestStationIndexValue = Signal(int)
+    requestStationIndexValues = Signal(list)
     @Slot(int)
     def request_station_index_value(self,station_id: int):
-        print(f"Request station index value: {station_id}")
-        self.requestStationIndexValue.emit(station_id)
+        logger.debug("Request station index value: %s", station_id)
+        self.requestStationIndexValues.emit([station_id])
+
+    # Jedno wywołanie przez QWebChannel dla wszystkich stacji, które pojawiły się w widoku
+    @Slot(list)
+    def request_station_index_values(self,station_ids: list):
+        logger.debug("Request station index values: %s", station_ids)
+        self.requestStationIndexValues.emit([int(station_id) for station_id in station_ids])
 
     leaftletLoaded = Signal()
     @Slot()
@@ -55,15 +97,16 @@ class StationMapViewWidget(QWidget):
 
         map_path = Path(__file__).with_name("station_map_view.html").resolve()
 
-        web.settings().setAttribute(web.settings().WebAttribute.LocalContentCanAccessRemoteUrls,True) #Ustawianie mozliwosci komunikacji sieciowej dla widgetu
         self.channel = QWebChannel()
 
-        page = web.page()
+        page = QWebEnginePage(_get_map_profile(), web)
+        web.setPage(page)
+        web.settings().setAttribute(web.settings().WebAttribute.LocalContentCanAccessRemoteUrls,True) #Ustawianie mozliwosci komunikacji sieciowej dla widgetu
         page.setWebChannel(self.channel)
         self.channel.registerObject("backend",self.backend) # Przekazanie obiektu do JavaScriptu
 
         self.stationSelected = self.backend.stationSelected
-        self.requestStationIndexValue = self.backend.requestStationIndexValue
+        self.requestStationIndexValues = self.backend.requestStationIndexValues
         self.leaftletLoaded = self.backend.leaftletLoaded
         web.load(QUrl.fromLocalFile(map_path))
 
@@ -75,12 +118,9 @@ class StationMapViewWidget(QWidget):
         color_scale_layout.setSpacing(0)
         color_scale_layout.setContentsMargins(0,0,0,0)
 
-        color_scale_list = list(AQ_INDEX_CATEGORIES_COLORS.items())
-        color_scale_list.sort(key=lambda x:x[0])
-
-        for (val,color) in color_scale_list:
-            label = QLabel(AQ_INDEX_CATEGORIES[val], color_scale)
-            label.setStyleSheet(f"background-color: #{color:06x}")
+        for (name,style) in _COLOR_SCALE:
+            label = QLabel(name, color_scale)
+            label.setStyleSheet(style)
             color_scale_layout.addWidget(label,1)
 
         layout = QVBoxLayout(self)
@@ -93,6 +133,10 @@ class StationMapViewWidget(QWidget):
     def add_station(self,lat: float,lng:float,station_id: int):
         self.backend.addStation.emit(lat,lng,station_id)
 
+    def add_stations(self,stations: list[dict]):
+        """Dodaje wszystkie stacje ({id, lat, lng}) jednym wywołaniem JavaScriptu zamiast sygnału na stację."""
+        self.web.page().runJavaScript(f"addStations({json_dumps(stations)})")
+
     def reset_indexes(self):
         self.backend.resetIndexes.emit()
 
@@ -101,4 +145,8 @@ class StationMapViewWidget(QWidget):
 
     @Slot(int,int)
     def init_index_value(self,station_id: int,value: int):
-        self.backend.initIndexValue.emit(station_id,value)
\ No newline at end of file
+        self.backend.initIndexValue.emit(station_id,value)
+
+    @Slot(list,list)
+    def init_index_values(self,station_ids: list[int],values: list[int]):
+        self.backend.initIndexValues.emit(station_ids,values)
\ No newline at end of file
@@ -1,17 +1,19 @@
 import logging
 from dataclasses import dataclass
+from datetime import datetime
 from typing import Sequence, cast, TYPE_CHECKING
 
-from PySide6.QtCore import Signal, Slot, Qt, QThreadPool, QRunnable, QObject
+import numpy as np
+from PySide6.QtCore import Signal, Slot, Qt, QThreadPool, QRunnable, QObject, QTimer, QSignalBlocker, \
+    QAbstractListModel, QModelIndex
 from PySide6.QtGui import QIntValidator
-from PySide6.QtWidgets import QWidget, QLineEdit, QComboBox, QFormLayout, QListWidget, QVBoxLayout, QHBoxLayout, \
-    QListWidgetItem, QMainWindow, QStatusBar, QLabel, QApplication, QMessageBox, QCheckBox, QSpacerItem
-from geopy.distance import distance
+from PySide6.QtWidgets import QWidget, QLineEdit, QComboBox, QFormLayout, QListView, QVBoxLayout, QHBoxLayout, \
+    QMainWindow, QStatusBar, QLabel, QApplication, QMessageBox, QCheckBox, QSpacerItem
 
 from src import location
-from src.config import AQ_TYPES, AQ_INDEX_CATEGORIES_COLORS, AQ_INDEX_CATEGORIES
+from src.config import AQ_TYPES, AQ_INDEX_CATEGORIES_COLORS, AQ_INDEX_CATEGORIES, UPDATE_INTERVALS
 from src.database.views import StationListView
-from src.fuzzy_seach import fuzzy_search
+from src.fuzzy_seach import FuzzyIndex
 from src.gui.station_map_view import StationMapViewWidget
 from src.repository import Repository
 
@@ -29,9 +31,17 @@ class FilterState:
 class StationSelectFilter(QWidget):
     filter_changed = Signal(FilterState)
 
+    # Opóźnienie filtrowania podczas pisania (ms) - seria naciśnięć daje jedno filtrowanie
+    QUERY_DEBOUNCE_MS = 200
+
     def __init__(self,cities: Sequence[str],*args,**kwargs):
         super().__init__()
 
+        self._debounce = QTimer(self)
+        self._debounce.setSingleShot(True)
+        self._debounce.setInterval(self.QUERY_DEBOUNCE_MS)
+        self._debounce.timeout.connect(self._on_filter_changed)
+
         self.search_query_input = QLineEdit(self)
         self.search_query_input.textChanged.connect(self._on_query_changed)
         self.search_query_input.editingFinished.connect(self._on_query_edit_finished)
@@ -74,6 +84,16 @@ class StationSelectFilter(QWidget):
         self.layout.addRow("", self.search_by_location_layout)
         self.layout.addRow("Miasto", self.city_combo)
 
+    def set_cities(self,cities: Sequence[str]):
+        """Podmienia listę miast, zachowując wybrane miasto, jeśli nadal jest na liście."""
+        current = self.current_city()
+        with QSignalBlocker(self.city_combo):
+            self.city_combo.clear()
+            self.city_combo.addItems(["Wybierz miasto", *cities])
+            if current in cities:
+                self.city_combo.setCurrentIndex(list(cities).index(current) + 1)
+        self._on_filter_changed()
+
     def current_city(self):
         return self.city_combo.currentText() if self.city_combo.currentIndex() > 0 else None
 
@@ -91,34 +111,105 @@ class StationSelectFilter(QWidget):
     @Slot()
     def _on_query_changed(self):
         if not self.search_by_location_checkbox.isChecked():
-            self._on_filter_changed()
+            self._debounce.start()
 
     @Slot()
     def _on_query_edit_finished(self):
+        self._debounce.stop()
         self._on_filter_changed()
 
 
 
+class StationListModel(QAbstractListModel):
+    """
+    Model listy stacji: pełna lista przechowywana raz, a filtr to tylko lista
+    indeksów widocznych wierszy. Qt pyta o dane wyłącznie dla widocznych elementów.
+    """
+
+    def __init__(self,parent: QObject = None):
+        super().__init__(parent)
+        self._stations: list[StationListView] = []
+        self._rows: list[int] = []
+
+    def rowCount(self,parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._rows)
+
+    def data(self,index: QModelIndex,role: int = Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+
+        station = self._stations[self._rows[index.row()]]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return station.name
+        if role == Qt.ItemDataRole.UserRole:
+            return station
+        return None
+
+    def set_stations(self,stations: list[StationListView]):
+        """Ustawia pełną listę stacji i pokazuje wszystkie."""
+        self.beginResetModel()
+        self._stations = stations
+        self._rows = list(range(len(stations)))
+        self.endResetModel()
+
+    def set_filtered(self,rows: Sequence[int]):
+        """Pokazuje tylko stacje o podanych indeksach (w podanej kolejności)."""
+        rows = [int(row) for row in rows]
+        if rows == self._rows:
+            return
+
+        self.beginResetModel()
+        self._rows = rows
+        self.endResetModel()
+
+
 class StationIndexFetcher(QRunnable):
     class Signals(QObject):
-        finished = Signal(int,int)
+        #                index_type, station_ids, values
+        finished = Signal(str,list,list)
+        #              index_type, station_ids
+        failed = Signal(str,list)
 
-    def __init__(self,station_id: int,index_type: str,repository: Repository):
-        logging.info(f"Fetcher created: station_id:  {station_id}, index_type: {index_type}")
+    def __init__(self,station_ids: list[int],index_type: str,repository: Repository):
+        logging.info(f"Fetcher created: station_ids:  {station_ids}, index_type: {index_type}")
         super().__init__()
-        self.station_id = station_id
+        self.station_ids = station_ids
         self.index_type = index_type
         self.repository = repository
         self.signals = self.Signals()
 
     def run(self):
-        own_repository = self.repository.clone()
-        value = own_repository.fetch_station_air_quality_index_value(self.station_id,self.index_type)
+        values = None
+        try:
+            with self.repository.acquire() as own_repository:
+                fetched = own_repository.fetch_station_air_quality_index_values(self.station_ids,self.index_type)
+
+            values = [fetched.get(station_id) for station_id in self.station_ids]
+            values = [-1 if value is None else value for value in values]
+        finally:
+            # sygnał jest wysyłany zawsze, aby widget mógł zwolnić stacje oczekujące na wynik
+            if values is None:
+                self.signals.failed.emit(self.index_type,self.station_ids)
+            else:
+                self.signals.finished.emit(self.index_type,self.station_ids,values)
+
+
+class StationListRefresher(QRunnable):
+    class Signals(QObject):
+        #                stations, cities
+        finished = Signal(list,list)
+
+    def __init__(self,repository: Repository):
+        super().__init__()
+        self.repository = repository
+        self.signals = self.Signals()
 
-        if value is None:
-             value = -1
+    def run(self):
+        with self.repository.acquire() as own_repository:
+            stations = own_repository.get_station_list_view()
+            cities = own_repository.get_cities()
 
-        self.signals.finished.emit(self.station_id,value)
+        self.signals.finished.emit(stations,cities)
 
 
 class StationSelectWidget(QMainWindow):
@@ -129,7 +220,9 @@ class StationSelectWidget(QMainWindow):
 
         self.repository = repository
 
-        self.thread_pool = QThreadPool.globalInstance()
+        # Własna pula wątków o rozmiarze puli połączeń - nadmiarowe wątki tylko czekałyby na połączenie
+        self.thread_pool = QThreadPool(self)
+        self.thread_pool.setMaxThreadCount(repository.max_workers())
 
         # Główny layout HBox
         main = QWidget(self)
@@ -139,21 +232,21 @@ class StationSelectWidget(QMainWindow):
         left.setMinimumSize(350,450)
         left_layout = QVBoxLayout(left)
 
-        self.stations = repository.get_station_list_view()
-        self.filtered_stations = self.stations
-
-        cities = sorted({st.city for st in self.stations})
+        # Dane z bazy od razu; odświeżenie z API (jeśli potrzebne) odbywa się w tle
+        self.stations_list_model = StationListModel(self)
+        self._set_stations(repository.get_station_list_view(refresh=False))
 
-        self.select_filter_widget = StationSelectFilter(parent=left, cities=cities)
+        self.select_filter_widget = StationSelectFilter(parent=left, cities=repository.get_cities())
         self.select_filter_widget.filter_changed.connect(self.on_filter_changed)
 
-        self.stations_list_widget = QListWidget(left)
-        self.set_station_list_items(self.stations)
-        self.stations_list_widget.itemClicked.connect(self.on_station_clicked)
-        self.stations_list_widget.itemDoubleClicked.connect(self.on_station_double_clicked)
+        self.stations_list_view = QListView(left)
+        self.stations_list_view.setUniformItemSizes(True)
+        self.stations_list_view.setModel(self.stations_list_model)
+        self.stations_list_view.clicked.connect(self.on_station_clicked)
+        self.stations_list_view.doubleClicked.connect(self.on_station_double_clicked)
 
         left_layout.addWidget(self.select_filter_widget)
-        left_layout.addWidget(self.stations_list_widget)
+        left_layout.addWidget(self.stations_list_view)
 
         # PRAWA CZĘŚĆ
         right = QWidget(main,visible=False)
@@ -168,16 +261,25 @@ class StationSelectWidget(QMainWindow):
         self.aq_index_type_combo.currentIndexChanged.connect(self.on_aq_index_changed)
         aq_index_type_form.addRow("Indeks:", self.aq_index_type_combo)
 
-        # Widget mapy
-        self.map_view = StationMapViewWidget(parent=right)
-        self.map_view.leaftletLoaded.connect(lambda : right.setVisible(True))
-        self.map_view.web.loadFinished.connect(self.on_map_loaded)
-        self.map_view.stationSelected.connect(self.on_station_marker_clicked)
-        self.map_view.requestStationIndexValue.connect(self.on_request_station_index_value)
+        # Wartości indeksów już pobrane (z czasem pobrania) i właśnie pobierane,
+        # kluczem jest (station_id, typ indeksu)
+        self._index_cache: dict[tuple[int, str], tuple[datetime, int]] = {}
+        self._inflight: set[tuple[int, str]] = set()
+        # Żądania z mapy zbierane przez krótki czas i obsługiwane razem
+        self._pending_index_requests: list[int] = []
+        self._index_request_timer = QTimer(self)
+        self._index_request_timer.setSingleShot(True)
+        self._index_request_timer.setInterval(self.INDEX_REQUEST_COALESCE_MS)
+        self._index_request_timer.timeout.connect(self._flush_index_requests)
+
+        # Widget mapy - tworzony dopiero po pokazaniu okna (silnik przeglądarki startuje długo)
+        self._markers_done = False
+        self.map_view: StationMapViewWidget | None = None
+        self._right_layout = right_layout
+        QTimer.singleShot(0, self._create_map_view)
 
 
         right_layout.addLayout(aq_index_type_form, stretch=0)
-        right_layout.addWidget(self.map_view, stretch=1)
 
         # DODANIE DO GŁÓWNEGO
         main_layout = QHBoxLayout(main)
@@ -207,6 +309,40 @@ class StationSelectWidget(QMainWindow):
         app = cast('Application',QApplication.instance())
         app.api_connection_status_changed.connect(self.on_api_connection_status_changed)
 
+        if repository.station_list_needs_update():
+            refresher = StationListRefresher(repository)
+            refresher.signals.finished.connect(self.on_station_list_refreshed)
+            self.thread_pool.start(refresher)
+
+    @Slot()
+    def _create_map_view(self):
+        self.map_view = StationMapViewWidget(parent=self.right)
+        self.map_view.leaftletLoaded.connect(lambda : self.right.setVisible(True))
+        self.map_view.web.loadFinished.connect(self.on_map_loaded)
+        self.map_view.stationSelected.connect(self.on_station_marker_clicked)
+        self.map_view.requestStationIndexValues.connect(self.on_request_station_index_values)
+        self._right_layout.addWidget(self.map_view, stretch=1)
+
+    def _set_stations(self,stations: list[StationListView]):
+        self.stations = sorted(stations, key=lambda st: st.name)
+        self.filtered_stations = self.stations
+        self.station_name_index = FuzzyIndex(st.name for st in self.stations)
+        # Kolumny atrybutów stacji (w kolejności self.stations) do filtrowania maskami
+        self._cities = np.array([st.city for st in self.stations], dtype=object)
+        # Współrzędne stacji w radianach do wektorowego filtrowania po odległości
+        self._lat_rad = np.radians(np.fromiter((st.latitude for st in self.stations), dtype=np.float64, count=len(self.stations)))
+        self._lng_rad = np.radians(np.fromiter((st.longitude for st in self.stations), dtype=np.float64, count=len(self.stations)))
+        self.stations_list_model.set_stations(self.stations)
+
+    @Slot(list,list)
+    def on_station_list_refreshed(self,stations: list[StationListView],cities: list[str]):
+        self._set_stations(stations)
+        # ponowne filtrowanie z nową listą miast odświeża też listę stacji
+        self.select_filter_widget.set_cities(cities)
+        if self._markers_done:
+            self._markers_done = False
+            self.setup_markers()
+
 
     @Slot(bool)
     def on_api_connection_status_changed(self,value: bool):
@@ -247,54 +383,45 @@ class StationSelectWidget(QMainWindow):
 
     @Slot(FilterState)
     def on_filter_changed(self,state: FilterState):
-        self.filtered_stations = self.stations
+        # Wszystkie warunki składane są w jedną maskę nad kolumnami stacji
+        mask = np.ones(len(self.stations), dtype=bool)
         if state.city is not None:
-            self.filtered_stations = [
-                st for st in self.filtered_stations
-                if st.city == state.city
-            ]
+            mask &= self._cities == state.city
 
-        if state.search_query != '':
-            if state.search_by_location: # Szukaj po lokalizacji
-                (lat,lng) = location.find_position(state.search_query)
-                self.map_view.set_position(lat,lng)
-                self.filtered_stations = [
-                    st for st in self.filtered_stations
-                    if distance((lat,lng),(st.latitude,st.longitude)).km <= state.range
-                ]
-            else: # Szukaj po nazwie
-                name_to_station = {
-                    st.name: st for st in self.filtered_stations
-                }
-                searched = fuzzy_search(state.search_query,name_to_station.keys(),score_cutoff=60)
-                self.filtered_stations = [
-                name_to_station[result] for result in searched
-                ]
+        if state.search_query != '' and not state.search_by_location: # Szukaj po nazwie
+            # kolejność według dopasowania, maska tylko odrzuca stacje z innych miast
+            searched = self.station_name_index(state.search_query,score_cutoff=60)
+            indices = [i for i in searched if mask[i]]
         else:
-            self.filtered_stations.sort(key=lambda x: x.name)
-
-        self.set_station_list_items(self.filtered_stations)
-
-    def set_station_list_items(self,stations: list[StationListView]):
-        self.stations_list_widget.clear()
+            if state.search_query != '': # Szukaj po lokalizacji
+                (lat,lng) = location.find_position(state.search_query)
+                if self.map_view is not None:
+                    self.map_view.set_position(lat,lng)
+                mask &= location.haversine_km(lat,lng,self._lat_rad,self._lng_rad) <= state.range
+            indices = np.flatnonzero(mask)
 
-        for st in stations:
-            item = QListWidgetItem(st.name,listview=self.stations_list_widget)
-            item.setData(Qt.ItemDataRole.UserRole,st)
+        self.filtered_stations = [self.stations[i] for i in indices]
+        self.stations_list_model.set_filtered(indices)
 
     def setup_markers(self):
-        for st in self.stations:
-            self.map_view.add_station(st.latitude,st.longitude,st.id)
-
-    @Slot(QListWidgetItem)
-    def on_station_double_clicked(self,item: QListWidgetItem):
-        station = item.data(Qt.ItemDataRole.UserRole)
+        if self._markers_done:
+            return
+        self.map_view.add_stations([
+            {"id": st.id, "lat": st.latitude, "lng": st.longitude}
+            for st in self.stations
+        ])
+        self._markers_done = True
+
+    @Slot(QModelIndex)
+    def on_station_double_clicked(self,index: QModelIndex):
+        station = index.data(Qt.ItemDataRole.UserRole)
         self.stationSelected.emit(station.id)
 
-    @Slot(QListWidgetItem)
-    def on_station_clicked(self,item: QListWidgetItem):
-        station = item.data(Qt.ItemDataRole.UserRole)
-        self.map_view.set_position(station.latitude,station.longitude)
+    @Slot(QModelIndex)
+    def on_station_clicked(self,index: QModelIndex):
+        station = index.data(Qt.ItemDataRole.UserRole)
+        if self.map_view is not None:
+            self.map_view.set_position(station.latitude,station.longitude)
 
     @Slot(int)
     def on_station_marker_clicked(self,station_id: int):
@@ -302,13 +429,69 @@ class StationSelectWidget(QMainWindow):
 
     @Slot(int)
     def on_aq_index_changed(self,index: int):
-        self.map_view.reset_indexes()
+        # pamięć podręczna zostaje - klucze zawierają typ indeksu, więc powrót
+        # do poprzedniego typu korzysta z jeszcze aktualnych wartości
+        if self.map_view is not None:
+            self.map_view.reset_indexes()
+
+    # Ile stacji obsługuje jedno zadanie - partie nadal pobierane są równolegle w puli wątków
+    INDEX_FETCH_BATCH_SIZE = 8
+    # Czas (ms), przez który żądania z kolejnych przesunięć mapy łączone są w jedno
+    INDEX_REQUEST_COALESCE_MS = 50
+
+    @Slot(list)
+    def on_request_station_index_values(self,station_ids: list[int]):
+        self._pending_index_requests.extend(station_ids)
+        # timer nie jest restartowany, aby ciągłe przesuwanie mapy nie opóźniało wyników
+        if not self._index_request_timer.isActive():
+            self._index_request_timer.start()
 
-    @Slot(int)
-    def on_request_station_index_value(self,station_id: int):
-        current_index = self.aq_index_type_combo.currentText()
-
-        task = StationIndexFetcher(station_id,current_index,self.repository)
-        task.signals.finished.connect(self.map_view.init_index_value)
+    @Slot()
+    def _flush_index_requests(self):
+        # bez powtórzeń, z zachowaniem kolejności żądań
+        station_ids = list(dict.fromkeys(self._pending_index_requests))
+        self._pending_index_requests.clear()
 
-        self.thread_pool.start(task)
+        current_index = self.aq_index_type_combo.currentText()
+        now = datetime.now()
+
+        cached_ids, cached_values, to_fetch = [], [], []
+        for station_id in station_ids:
+            key = (station_id, current_index)
+            cached = self._index_cache.get(key)
+            # wartości starsze niż interwał aktualizacji indeksów pobierane są ponownie
+            if cached is not None and now - cached[0] < UPDATE_INTERVALS['aq_indexes']:
+                cached_ids.append(station_id)
+                cached_values.append(cached[1])
+            elif key not in self._inflight:
+                self._inflight.add(key)
+                to_fetch.append(station_id)
+
+        if cached_ids:
+            self.map_view.init_index_values(cached_ids,cached_values)
+
+        for start in range(0,len(to_fetch),self.INDEX_FETCH_BATCH_SIZE):
+            batch = to_fetch[start:start + self.INDEX_FETCH_BATCH_SIZE]
+            task = StationIndexFetcher(batch,current_index,self.repository)
+            task.signals.finished.connect(self.on_station_index_values_fetched)
+            task.signals.failed.connect(self.on_station_index_values_failed)
+
+            self.thread_pool.start(task)
+
+    @Slot(str,list)
+    def on_station_index_values_failed(self,index_type: str,station_ids: list[int]):
+        # stacje mogą zostać ponownie zażądane przy kolejnym przesunięciu mapy
+        for station_id in station_ids:
+            self._inflight.discard((station_id, index_type))
+
+    @Slot(str,list,list)
+    def on_station_index_values_fetched(self,index_type: str,station_ids: list[int],values: list[int]):
+        fetched_at = datetime.now()
+        for station_id, value in zip(station_ids,values):
+            key = (station_id, index_type)
+            self._inflight.discard(key)
+            self._index_cache[key] = (fetched_at, value)
+
+        # wyniki dla poprzednio wybranego typu indeksu nie trafiają już na mapę
+        if index_type == self.aq_index_type_combo.currentText():
+            self.map_view.init_index_values(station_ids,values)
@@ -1,11 +1,46 @@
+import time
+from functools import lru_cache
+
+import numpy as np
 from geopy import Nominatim
-from geopy.distance import distance
 import geocoder
 
+EARTH_RADIUS_KM = 6371.0
+
+_locator = Nominatim(user_agent="DaVinci Project - Test")
+
+# Położenie z adresu IP rzadko zmienia się w trakcie sesji - ważne przez 5 minut
+CURRENT_LOCATION_TTL_S = 5 * 60
+_current_location: tuple[float, tuple[float,float]] | None = None  # (czas odczytu, (lat, lng))
+
 def find_position(location_name: str) -> tuple[float,float]:
-    locator = Nominatim(user_agent="DaVinci Project - Test")
-    location = locator.geocode(location_name,exactly_one=True)
+    # To samo zapytanie (bez względu na wielkość liter i spacje) nie trafia ponownie do Nominatim
+    return _geocode(" ".join(location_name.split()).lower())
+
+@lru_cache(maxsize=512)
+def _geocode(query: str) -> tuple[float,float]:
+    location = _locator.geocode(query,exactly_one=True)
     return location.latitude, location.longitude
 
 def current_location() -> tuple[float,float]:
-    return geocoder.ip('me').latlng
+    global _current_location
+    now = time.monotonic()
+    if _current_location is not None and now - _current_location[0] < CURRENT_LOCATION_TTL_S:
+        return _current_location[1]
+
+    latlng = geocoder.ip('me').latlng
+    # Nieudane zapytanie zwraca [] - nie zapamiętujemy go, kolejne wywołanie spróbuje ponownie
+    if latlng:
+        _current_location = (now, latlng)
+    return latlng
+
+def haversine_km(lat: float, lng: float, latitudes_rad: np.ndarray, longitudes_rad: np.ndarray) -> np.ndarray:
+    """
+    Odległości (km) od punktu (lat, lng) w stopniach do wszystkich punktów
+    podanych jako tablice szerokości i długości geograficznych w radianach.
+    """
+    lat_rad = np.radians(lat)
+    dlat = latitudes_rad - lat_rad
+    dlng = longitudes_rad - np.radians(lng)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat_rad) * np.cos(latitudes_rad) * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
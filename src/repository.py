@@ -1,12 +1,16 @@
 import logging
+from contextlib import contextmanager
 from datetime import datetime, timedelta
+from typing import Iterator
 
+import numpy as np
 import requests.exceptions
 
 import src.database.views as views
 from src.api.client import Client as APIClient
+from src.api.exceptions import APIError
 from src.config import UPDATE_INTERVALS
-from src.database.client import Client as DatabaseClient
+from src.database.client import Client as DatabaseClient, ClientPool as DatabaseClientPool
 
 
 class Repository:
@@ -20,22 +24,58 @@ class Repository:
       - pobieranie i aktualizację szczegółowych danych jakości powietrza dla konkretnej stacji.
     """
 
-    def __init__(self, api_client: APIClient, database_client: DatabaseClient):
+    def __init__(
+            self,
+            api_client: APIClient,
+            database_client: DatabaseClient,
+            database_pool: DatabaseClientPool = None,
+            last_update_cache: dict[tuple, datetime] = None
+    ):
         """
         Inicjalizuje instancję repozytorium.
 
         Args:
             api_client (api.Client): Klient do komunikacji z zewnętrznym API.
             database_client (database.Client): Klient do operacji na lokalnej bazie danych.
+            database_pool (database.ClientPool): Pula połączeń dla wątków roboczych;
+                domyślnie tworzona na podstawie `database_client`.
+            last_update_cache (dict): Współdzielone daty ostatnich aktualizacji;
+                przekazywane repozytoriom z `acquire()`.
         """
         self._api_client = api_client
         self._database_client = database_client
+        self._database_pool = database_pool or database_client.create_pool()
+        # (ważna do, lista stacji) - lista zwracana bez sprawdzania bazy do czasu kolejnej aktualizacji
+        self._station_list_cache: tuple[datetime, list[views.StationListView]] | None = None
+        # Posortowane miasta stacji, liczone przy każdym odczycie listy stacji z bazy
+        self._cities: list[str] = []
+        # Daty ostatnich aktualizacji: ("stations",), ("aq", station_id), ("sensors", station_id).
+        # Odczytywane z bazy tylko przy braku wpisu, nadpisywane po udanej aktualizacji.
+        self._last_update_cache = {} if last_update_cache is None else last_update_cache
 
     def api_client(self):
         return self._api_client
 
-    def clone(self):
-        return Repository(self._api_client,self._database_client.duplicate_connection())
+    def max_workers(self) -> int:
+        """Liczba wątków, które mogą jednocześnie korzystać z repozytorium bez czekania na połączenie."""
+        return self._database_pool.max_size
+
+    @contextmanager
+    def acquire(self) -> Iterator['Repository']:
+        """
+        Zwraca repozytorium korzystające z połączenia wypożyczonego z puli,
+        bezpieczne do użycia w wątku roboczym na czas bloku `with`.
+        """
+        with self._database_pool.acquire() as database_client:
+            yield Repository(self._api_client, database_client, self._database_pool, self._last_update_cache)
+
+    def _last_update(self, key: tuple, fetch) -> datetime:
+        """Zwraca datę ostatniej aktualizacji z pamięci, a przy jej braku odczytuje ją przez `fetch()`."""
+        last_update_at = self._last_update_cache.get(key)
+        if last_update_at is None:
+            last_update_at = fetch()
+            self._last_update_cache[key] = last_update_at
+        return last_update_at
 
     # Ta fukcja nie jest prywatna poniewaz moze sluzyc do odswierzenia
     def update_stations(self):
@@ -52,31 +92,62 @@ class Repository:
         self._database_client.update_stations(
             stations=api_stations
         )
+        self._station_list_cache = None
+        self._last_update_cache[("stations",)] = datetime.now()
+
+    def station_list_needs_update(self) -> bool:
+        """Czy od ostatniej aktualizacji listy stacji minął interwał `UPDATE_INTERVALS['station']`."""
+        last_update_at = self._last_update(("stations",), self._database_client.get_last_stations_update)
+        return datetime.now() - last_update_at >= UPDATE_INTERVALS['station']
 
-    def get_station_list_view(self) -> list[views.StationListView]:
+    def get_station_list_view(self, refresh: bool = True) -> list[views.StationListView]:
         """
         Zwraca widok listy stacji, odświeżając dane jeśli upłynął zdefiniowany interwał.
 
         Jeśli od ostatniej aktualizacji minął czas określony w `UPDATE_INTERVALS['station']`,
         następuje wywołanie `update_stations()`.
 
+        Args:
+            refresh (bool): Gdy False, zwraca dane z bazy bez odświeżania z API
+                (np. aby odświeżyć je później w wątku roboczym).
+
         Returns:
             list[database.views.StationListView]: Lista obiektów widoku stacji.
         """
-        last_update_at = self._database_client.get_last_stations_update()
-        elapsed = datetime.now() - last_update_at
+        now = datetime.now()
+        if self._station_list_cache is not None:
+            valid_until, stations = self._station_list_cache
+            if now < valid_until:
+                return list(stations)
+
+        last_update_at = self._last_update(("stations",), self._database_client.get_last_stations_update)
+        elapsed = now - last_update_at
 
         try:
-            if elapsed >= UPDATE_INTERVALS['station']:
+            if refresh and elapsed >= UPDATE_INTERVALS['station']:
                 self.update_stations()
+                last_update_at = self._last_update_cache[("stations",)]
         except requests.exceptions.ConnectionError as e:
             logging.warning("Error while updating stations: %s",e)
 
-        return self._database_client.get_station_list_view()
+        stations = self._database_client.get_station_list_view()
+        self._cities = sorted({st.city for st in stations})
+        # lista jest aktualna do momentu, w którym minie interwał od ostatniej aktualizacji
+        self._station_list_cache = (last_update_at + UPDATE_INTERVALS['station'], stations)
+        return list(stations)
 
 
+    def get_cities(self) -> list[str]:
+        """
+        Zwraca posortowane nazwy miast stacji z ostatniego odczytu `get_station_list_view()`.
+
+        Returns:
+            list[str]: Lista nazw miast bez powtórzeń.
+        """
+        return list(self._cities)
+
     def fetch_station_details_view(self, station_id: int) -> views.StationDetailsView:
-        last_update_at = self._database_client.get_last_stations_update()
+        last_update_at = self._last_update(("stations",), self._database_client.get_last_stations_update)
         elapsed = datetime.now() - last_update_at
 
         try:
@@ -101,6 +172,7 @@ class Repository:
             station_id=station_id,
             indexes=air_quality_indexes
         )
+        self._last_update_cache[("aq", station_id)] = datetime.now()
 
     def fetch_station_air_quality_index_value(self, station_id: int,type_codename: str) -> int:
         """
@@ -113,7 +185,10 @@ class Repository:
         Returns:
             list[database.views.AQIndexView]: Lista obiektów widoku wskaźników jakości powietrza.
         """
-        last_update_at = self._database_client.fetch_last_station_air_quality_indexes_update(station_id)
+        last_update_at = self._last_update(
+            ("aq", station_id),
+            lambda: self._database_client.fetch_last_station_air_quality_indexes_update(station_id)
+        )
         elapsed = datetime.now() - last_update_at
 
         try:
@@ -124,12 +199,43 @@ class Repository:
 
         return self._database_client.fetch_station_air_quality_index_value(station_id, type_codename)
 
+    def fetch_station_air_quality_index_values(self, station_ids: list[int], type_codename: str) -> dict[int, int]:
+        """
+        Jak fetch_station_air_quality_index_value, ale dla wielu stacji naraz: daty
+        aktualizacji i wartości odczytywane są z bazy jednym zapytaniem, a z API
+        odświeżane są tylko stacje, których indeksy są nieaktualne.
+
+        Returns:
+            dict[int, int]: station_id -> wartość indeksu; stacje bez indeksu są pominięte.
+        """
+        missing = [station_id for station_id in station_ids if ("aq", station_id) not in self._last_update_cache]
+        if missing:
+            fetched = self._database_client.fetch_last_station_air_quality_indexes_updates(missing)
+            for station_id, last_update_at in fetched.items():
+                self._last_update_cache[("aq", station_id)] = last_update_at
+        now = datetime.now()
+
+        for station_id in station_ids:
+            if now - self._last_update_cache[("aq", station_id)] < UPDATE_INTERVALS['aq_indexes']:
+                continue
+            # błąd jednej stacji nie może przerwać odświeżania i odczytu pozostałych
+            try:
+                self.update_station_air_quality_indexes(station_id)
+            except (requests.exceptions.RequestException, APIError) as e:
+                logging.warning("Error while updating air quality index values of station %s: %s",station_id,e)
+
+        return self._database_client.fetch_station_air_quality_index_values(station_ids, type_codename)
+
     def update_station_sensors(self,station_id: int):
         stations = self._api_client.fetch_station_sensors(station_id)
         self._database_client.update_station_sensors(station_id, stations)
+        self._last_update_cache[("sensors", station_id)] = datetime.now()
 
     def fetch_station_sensors(self,station_id: int) -> list[views.SensorView]:
-        last_update_at = self._database_client.fetch_last_station_sensors_update(station_id)
+        last_update_at = self._last_update(
+            ("sensors", station_id),
+            lambda: self._database_client.fetch_last_station_sensors_update(station_id)
+        )
         elapsed = datetime.now() - last_update_at
 
         try:
@@ -144,32 +250,27 @@ class Repository:
     def update_sensor_data(self,sensor_id: int,date_from: datetime,date_to: datetime):
         now = datetime.now()
         from_delta = (now - date_from)
+        to_delta = (now - date_to)
 
+        # najpierw pobierz z API, potem zapisz wszystko w jednej transakcji
+        batches = []
         if from_delta >= timedelta(days=3,hours=1):
-            data = self._api_client.fetch_sensor_archival_data(
+            batches.append(self._api_client.fetch_sensor_archival_data(
                 sensor_id=sensor_id,
                 date_from=date_from,
                 date_to=date_to
-            )
-            self._database_client.update_sensor_data(sensor_id, data)
-
-        to_delta = (now - date_to)
+            ))
 
         if to_delta <= timedelta(days=3,hours=1):
-            data = self._api_client.fetch_sensor_data(sensor_id)
-            self._database_client.update_sensor_data(sensor_id, data)
+            batches.append(self._api_client.fetch_sensor_data(sensor_id))
 
+        with self._database_client.transaction():
+            for data in batches:
+                self._database_client.update_sensor_data(sensor_id, data)
 
-    def fetch_sensor_data(
-            self,
-            sensor_id: int,
-            date_from: datetime,
-            date_to: datetime = None
-    ) -> list[views.SensorValueView]:
-        # jeśli nie podano date_to, użyj teraz()
-        if date_to is None:
-            date_to = datetime.now()
 
+    def _refresh_sensor_data(self, sensor_id: int, date_from: datetime, date_to: datetime):
+        """Uzupełnia bazę o pomiary z API, jeśli zadany przedział wykracza poza zapisany zakres."""
         # pobierz zakres dostępny w bazie
         latest = self._database_client.fetch_latest_sensor_record_date(sensor_id)
         oldest = self._database_client.fetch_oldest_sensor_record_date(sensor_id)
@@ -190,5 +291,33 @@ class Repository:
         except requests.exceptions.ConnectionError as e:
             logging.warning("Error while updating sensor data: %s", e)
 
+    def fetch_sensor_data(
+            self,
+            sensor_id: int,
+            date_from: datetime,
+            date_to: datetime = None
+    ) -> list[views.SensorValueView]:
+        # jeśli nie podano date_to, użyj teraz()
+        if date_to is None:
+            date_to = datetime.now()
+
+        self._refresh_sensor_data(sensor_id, date_from, date_to)
+
         # w końcu zawsze zwracamy dane z bazy w zadanym przedziale
-        return self._database_client.fetch_sensor_data(sensor_id, date_from, date_to)
\ No newline at end of file
+        return self._database_client.fetch_sensor_data(sensor_id, date_from, date_to)
+
+    def fetch_sensor_data_arrays(
+            self,
+            sensor_id: int,
+            date_from: datetime,
+            date_to: datetime = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Jak fetch_sensor_data, ale zwraca (daty datetime64[s] w UTC, wartości float64).
+        """
+        if date_to is None:
+            date_to = datetime.now()
+
+        self._refresh_sensor_data(sensor_id, date_from, date_to)
+
+        return self._database_client.fetch_sensor_data_arrays(sensor_id, date_from, date_to)